@@ -54,7 +54,8 @@ if __name__ == "__main__":
     print("starting chrome")
     with main_test.Chrome(width=800, height=1000) as chrome:
         print("starting restaurant server")
-        with main_test.App(port=8080) as app:
+        with main_test.App(port=8080) as server:
+            app = server.url
             try:
 
                 do_login(chrome, app, "jeff", "password")
@@ -3,26 +3,61 @@ White-box data interface coverage tests for order state transitions.
 
 To verify that all lines were covered (which they should since we tested all
 expected inputs and outputs, and the transition_order function should not
-contain useless code), run "coverage run a5_test_ost.py", then "coverage report
--m". The missing lines should not intersect with the lines for the
-transition_order method in main.py (except for the AssertionError near the end).
+contain useless code), run "coverage run a5_test_ost.py", then "coverage
+combine" (the transitions are tested in parallel worker processes) and
+"coverage report -m". The missing lines should not intersect with the lines for
+the transition_order method in main.py (except for the AssertionError near the
+end).
 """
 
-import os
+import concurrent.futures
 import sqlite3
-import tempfile
 
-from typing import List, Tuple, Set
+from typing import Callable, List, Optional, Tuple, Set
 
 import main
 
+with open("database.sql", "r") as f:
+    _SCHEMA_SQL = f.read()
+
 class TestDB:
+    """
+    Creates a fresh, empty restaurant database for a single test case.
+
+    The database is a shared-cache in-memory one which only has its schema
+    loaded once per process. Each test case empties the tables instead of
+    creating a new database file, so there isn't any filesystem I/O.
+    """
+
+    URI = "file:a5_test_ost?mode=memory&cache=shared"
+
+    # keeps the in-memory database alive between test cases
+    _KEEPER = None
+
+    @classmethod
+    def _keeper(cls) -> sqlite3.Connection:
+        if cls._KEEPER is None:
+            c = sqlite3.connect(cls.URI, uri=True)
+            c.executescript(_SCHEMA_SQL)
+            cls._KEEPER = c
+        return cls._KEEPER
+
     def __init__(self):
-        self.fn = os.path.join(tempfile.mkdtemp(), "restaurant.db")
-        with sqlite3.connect(self.fn) as c:
-            with open("database.sql", "r") as f:
-                c.executescript(f.read())
-        self.db = main.RestaurantDB(self.fn)
+        TestDB._keeper()
+        self.db = main.RestaurantDB(TestDB.URI, uri=True, journal_mode="MEMORY")
+
+        # reset the ids too, so the error messages are the same for every test case
+        self.db.conn.executescript("""
+            BEGIN;
+            DELETE FROM OrderItems;
+            DELETE FROM Orders;
+            DELETE FROM MenuItems;
+            DELETE FROM RestaurantEmployees;
+            DELETE FROM Restaurants;
+            DELETE FROM Accounts;
+            DELETE FROM sqlite_sequence;
+            COMMIT;
+        """)
 
     def __enter__(self):
         return self.db
@@ -32,19 +67,23 @@ class TestDB:
             self.db.close()
         except:
             pass
-        for suffix in ["", "-shm", "-wal"]:
-            try:
-                os.remove(self.fn + suffix)
-            except:
-                pass
 
 def format_transitions(transitions: Set[Tuple[str, str]]) -> str:
     if not transitions:
         return "none"
     return ", ".join(f'{src}->{dst}' for src, dst in transitions)
 
-def test_order_state_transition(
-    name: str,
+PEND = main.RestaurantDB.ORDER_PENDING
+PAID = main.RestaurantDB.ORDER_PAID
+CANC = main.RestaurantDB.ORDER_CANCELLED
+ACC = main.RestaurantDB.ORDER_ACCEPTED
+DEL = main.RestaurantDB.ORDER_DELIVERED
+
+TARGET_STATUSES = [PEND, ACC, CANC, DEL, PAID]
+
+def run_order_state_transition(
+    status: str,
+    target_status: str,
     # input variables
     order_id_exists: bool = False,
     restaurant_is_deleted: bool = False,
@@ -54,297 +93,278 @@ def test_order_state_transition(
     items: List[Tuple[str, float, int]] = [],
     items_has_deleted: bool = False,
     items_has_other_restaurant: bool = False,
+) -> Optional[str]:
+    """
+    Sets up a fresh database with an order in the initial status, then attempts
+    to transition it to the target status. Returns None if the transition was
+    allowed, or the error message if it was rejected.
+
+    This is run in a worker process, so it must not share any state (e.g., the
+    database) with the other test cases.
+    """
+    with TestDB() as db:
+        try:
+            # do all of the setup in a single transaction
+            with db.batch():
+                # create the test user
+                username = "testuser"
+                db.create_account(username, "password", "Test", "User")
+
+                # create a dummy user
+                other_username = "dummy"
+                db.create_account(other_username, "password", "Dummy", "User")
+
+                # create the test restaurant
+                restaurant_id = db.create_restaurant("Test Restaurant", other_username)
+
+                # create a dummy restaurant
+                other_restaurant_id = db.create_restaurant("Dummy Restaurant", other_username)
+
+                # create the order as the username, or the alternate one if they don't own the order
+                order_id = db.create_order(restaurant_id, username if user_owns_order else other_username)
+
+                # add the user as a employee if required
+                if user_is_employee:
+                    db.add_restaurant_employee(restaurant_id, username)
+
+                # set up the users's billing info
+                if user_has_billing_info:
+                    db.update_account(username, "Test", "User", "123 Test St", "5555555555554444", "09/26", "567")
+
+                # add the test case items to the order
+                item_ids = db.add_menu_items(restaurant_id, [(item_name, int(item_price*100)) for item_name, item_price, _ in items])
+                order_items = [(item_id, quantity) for item_id, (_, _, quantity) in zip(item_ids, items) if quantity > 0]
+                db.modify_order_items(order_id, order_items)
+                last_order_item_id = order_items[-1][0] if order_items else None
+
+                # apply the special item conditions to the last item in the order
+                if items_has_deleted:
+                    db.conn.execute("UPDATE MenuItems SET Deleted = TRUE WHERE ItemID = ?", (last_order_item_id,))
+                if items_has_other_restaurant:
+                    db.conn.execute("UPDATE MenuItems SET RestaurantID = ? WHERE ItemID = ?", (other_restaurant_id, last_order_item_id))
+
+                # override the current order status to the initial one for the test case
+                db.conn.execute("UPDATE Orders SET Status = ? WHERE OrderID = ?", (status, order_id))
+
+                # maybe delete the restaurant
+                if restaurant_is_deleted:
+                    db.delete_restaurant(restaurant_id)
+
+        except Exception as ex:
+            raise Exception("failed to set up initial test case state") from ex
+
+        try:
+            db.transition_order(username, restaurant_id if not order_id_exists else None, order_id if order_id_exists else 100, target_status)
+        except main.OrderTransitionError as ex:
+            return str(ex)
+        except Exception as ex:
+            raise Exception(f"unexpected exception while testing state transition {status} -> {target_status}") from ex
+        return None
+
+def test_order_state_transition(
+    executor: concurrent.futures.Executor,
+    name: str,
     order_status: Set[str] = set(),
     # output
     allowed_transitions: Set[Tuple[str, str]] = set(),
-) -> bool:
-    print()
-    print(f"> RUN  {name}")
-
-    transitions = set()
+    # input variables (see run_order_state_transition)
+    **inputs,
+) -> Callable[[], bool]:
+    """
+    Submits every transition for the test case to the executor, returning a
+    function which waits for the results and checks them (stopping at the first
+    transition which shouldn't have been allowed).
+    """
+    futures = []
     for status in order_status:
-        for target_status in [
-            main.RestaurantDB.ORDER_PENDING,
-            main.RestaurantDB.ORDER_ACCEPTED,
-            main.RestaurantDB.ORDER_CANCELLED,
-            main.RestaurantDB.ORDER_DELIVERED,
-            main.RestaurantDB.ORDER_PAID,
-        ]:
+        for target_status in TARGET_STATUSES:
             if target_status == status:
                 continue
-            with TestDB() as db:
-                try:
-                    # create the test user
-                    username = "testuser"
-                    db.create_account(username, "password", "Test", "User")
-
-                    # create a dummy user
-                    other_username = "dummy"
-                    db.create_account(other_username, "password", "Dummy", "User")
-
-                    # create the test restaurant
-                    restaurant_id = db.create_restaurant("Test Restaurant", other_username)
-
-                    # create a dummy restaurant
-                    other_restaurant_id = db.create_restaurant("Dummy Restaurant", other_username)
-
-                    # create the order as the username, or the alternate one if they don't own the order
-                    order_id = db.create_order(restaurant_id, username if user_owns_order else other_username)
-
-                    # add the user as a employee if required
-                    if user_is_employee:
-                        db.add_restaurant_employee(restaurant_id, username)
-
-                    # set up the users's billing info
-                    if user_has_billing_info:
-                        db.update_account(username, "Test", "User", "123 Test St", "5555555555554444", "09/26", "567")
-
-                    # add the test case items to the order
-                    last_order_item_id = None
-                    for item_name, item_price, quantity in items:
-                        item_id = db.add_menu_item(restaurant_id, item_name, int(item_price*100))
-                        if quantity > 0:
-                            db.modify_order_item(order_id, item_id, quantity)
-                            last_order_item_id = item_id
-
-                    # apply the special item conditions to the last item in the order
-                    if items_has_deleted:
-                        db.conn.execute("UPDATE MenuItems SET Deleted = TRUE WHERE ItemID = ?", (last_order_item_id,))
-                    if items_has_other_restaurant:
-                        db.conn.execute("UPDATE MenuItems SET RestaurantID = ? WHERE ItemID = ?", (other_restaurant_id, last_order_item_id))
-
-                    # override the current order status to the initial one for the test case
-                    db.conn.execute("UPDATE Orders SET Status = ? WHERE OrderID = ?", (status, order_id))
-
-                    # maybe delete the restaurant
-                    if restaurant_is_deleted:
-                        db.delete_restaurant(restaurant_id)
-
-                except Exception as ex:
-                    raise Exception("failed to set up initial test case state") from ex
-
-                try:
-                    db.transition_order(username, restaurant_id if not order_id_exists else None, order_id if order_id_exists else 100, target_status)
-                except main.OrderTransitionError as ex:
-                    print(f"  [N]  {status:10s} -> {target_status:10s} :: {ex}")
-                    continue
-                except Exception as ex:
-                    raise Exception(f"unexpected exception while testing state transition {status} -> {target_status}") from ex
-            
-                print(f"  [Y]  {status:10s} -> {target_status:10s}")
-                transitions.add((status, target_status))
-    
-    if transitions != allowed_transitions:
-        print(f"* FAIL expected only {format_transitions(allowed_transitions)} to be allowed, got {format_transitions(transitions)}")
-        return False
-    else:
-        print(f"- PASS allowed transitions {format_transitions(allowed_transitions)}")
-        return True
+            futures.append((status, target_status, executor.submit(run_order_state_transition, status, target_status, **inputs)))
 
-if __name__ == "__main__":
-    fail = 0
+    def check() -> bool:
+        print()
+        print(f"> RUN  {name}")
 
-    fail += not test_order_state_transition(
-        "pending order: invalid order id for restaurant",
+        transitions = set()
+        for status, target_status, future in futures:
+            err = future.result()
+            if err is not None:
+                print(f"  [N]  {status:10s} -> {target_status:10s} :: {err}")
+                continue
+            print(f"  [Y]  {status:10s} -> {target_status:10s}")
+            transitions.add((status, target_status))
+
+            # no need to wait for the rest once we know it failed
+            if (status, target_status) not in allowed_transitions:
+                for _, _, other in futures:
+                    other.cancel()
+                print(f"* FAIL {status} -> {target_status} was allowed, but expected only {format_transitions(allowed_transitions)} to be allowed")
+                return False
+
+        if transitions != allowed_transitions:
+            print(f"* FAIL expected only {format_transitions(allowed_transitions)} to be allowed, got {format_transitions(transitions)}")
+            return False
+        else:
+            print(f"- PASS allowed transitions {format_transitions(allowed_transitions)}")
+            return True
+
+    return check
+
+# the items used for most test cases (name, price, quantity in the order)
+ITEMS = [
+    ("Water", 1.23, 1),
+    ("Pop", 2.34, 0),
+    ("Burger", 3.45, 1),
+]
+
+CASES = [
+    dict(
+        name="pending order: invalid order id for restaurant",
         order_id_exists=False,
-        items=[
-            ("Water", 1.23, 1),
-            ("Pop", 2.34, 0),
-            ("Burger", 3.45, 1),
-        ],
-        order_status=set([main.RestaurantDB.ORDER_PENDING]),
+        items=ITEMS,
+        order_status={PEND},
         allowed_transitions=set(),
-    )
-    fail += not test_order_state_transition(
-        "pending order: restaurant is deleted",
+    ),
+    dict(
+        name="pending order: restaurant is deleted",
         order_id_exists=True,
         restaurant_is_deleted=True,
-        items=[
-            ("Water", 1.23, 1),
-            ("Pop", 2.34, 0),
-            ("Burger", 3.45, 1),
-        ],
-        order_status=set([main.RestaurantDB.ORDER_PENDING]),
+        items=ITEMS,
+        order_status={PEND},
         allowed_transitions=set(),
-    )
-    fail += not test_order_state_transition(
-        "pending order: order was created by a different customer",
+    ),
+    dict(
+        name="pending order: order was created by a different customer",
         order_id_exists=True,
         restaurant_is_deleted=False,
         user_owns_order=False,
-        items=[
-            ("Water", 1.23, 1),
-            ("Pop", 2.34, 0),
-            ("Burger", 3.45, 1),
-        ],
-        order_status=set([main.RestaurantDB.ORDER_PENDING]),
+        items=ITEMS,
+        order_status={PEND},
         allowed_transitions=set(),
-    )
-    fail += not test_order_state_transition(
-        "pending order: customer does not have billing information",
+    ),
+    dict(
+        name="pending order: customer does not have billing information",
         order_id_exists=True,
         restaurant_is_deleted=False,
         user_owns_order=True,
         user_has_billing_info=False,
-        items=[
-            ("Water", 1.23, 1),
-            ("Pop", 2.34, 0),
-            ("Burger", 3.45, 1),
-        ],
-        order_status=set([main.RestaurantDB.ORDER_PENDING]),
-        allowed_transitions=set([
-            (main.RestaurantDB.ORDER_PENDING, main.RestaurantDB.ORDER_CANCELLED),
-        ]),
-    )
-    fail += not test_order_state_transition(
-        "pending order: order contains items it shouldn't",
+        items=ITEMS,
+        order_status={PEND},
+        allowed_transitions={
+            (PEND, CANC),
+        },
+    ),
+    dict(
+        name="pending order: order contains items it shouldn't",
         order_id_exists=True,
         restaurant_is_deleted=False,
         user_owns_order=True,
         user_has_billing_info=True,
-        items=[
-            ("Water", 1.23, 1),
-            ("Pop", 2.34, 0),
-            ("Burger", 3.45, 1),
-        ],
+        items=ITEMS,
         items_has_other_restaurant=True,
-        order_status=set([main.RestaurantDB.ORDER_PENDING]),
-        allowed_transitions=set([
-            (main.RestaurantDB.ORDER_PENDING, main.RestaurantDB.ORDER_CANCELLED),
-        ]),
-    )
-    fail += not test_order_state_transition(
-        "pending order: order contains deleted item",
+        order_status={PEND},
+        allowed_transitions={
+            (PEND, CANC),
+        },
+    ),
+    dict(
+        name="pending order: order contains deleted item",
         order_id_exists=True,
         restaurant_is_deleted=False,
         user_owns_order=True,
         user_has_billing_info=True,
-        items=[
-            ("Water", 1.23, 1),
-            ("Pop", 2.34, 0),
-            ("Burger", 3.45, 1),
-        ],
+        items=ITEMS,
         items_has_deleted=True,
-        order_status=set([main.RestaurantDB.ORDER_PENDING]),
-        allowed_transitions=set([
-            (main.RestaurantDB.ORDER_PENDING, main.RestaurantDB.ORDER_CANCELLED),
-        ]),
-    )
-    fail += not test_order_state_transition(
-        "pending order: order does not contain any items",
+        order_status={PEND},
+        allowed_transitions={
+            (PEND, CANC),
+        },
+    ),
+    dict(
+        name="pending order: order does not contain any items",
         order_id_exists=True,
         restaurant_is_deleted=False,
         user_owns_order=True,
         user_has_billing_info=True,
         items=[],
-        order_status=set([main.RestaurantDB.ORDER_PENDING]),
-        allowed_transitions=set([
-            (main.RestaurantDB.ORDER_PENDING, main.RestaurantDB.ORDER_CANCELLED),
-        ]),
-    )
-    fail += not test_order_state_transition(
-        "is someone else's order (not an employee)",
+        order_status={PEND},
+        allowed_transitions={
+            (PEND, CANC),
+        },
+    ),
+    dict(
+        name="is someone else's order (not an employee)",
         order_id_exists=True,
         restaurant_is_deleted=False,
         user_owns_order=False,
         user_is_employee=False,
         user_has_billing_info=True,
-        items=[
-            ("Water", 1.23, 1),
-            ("Pop", 2.34, 0),
-            ("Burger", 3.45, 1),
-        ],
-        order_status=set([
-            main.RestaurantDB.ORDER_PENDING,
-            main.RestaurantDB.ORDER_ACCEPTED,
-            main.RestaurantDB.ORDER_CANCELLED,
-            main.RestaurantDB.ORDER_DELIVERED,
-            main.RestaurantDB.ORDER_PAID,
-        ]),
-        allowed_transitions=set([
-        ]),
-    )
-    fail += not test_order_state_transition(
-        "is user's order (not an employee)",
+        items=ITEMS,
+        order_status={PEND, ACC, CANC, DEL, PAID},
+        allowed_transitions=set(),
+    ),
+    dict(
+        name="is user's order (not an employee)",
         order_id_exists=True,
         restaurant_is_deleted=False,
         user_owns_order=True,
         user_is_employee=False,
         user_has_billing_info=True,
-        items=[
-            ("Water", 1.23, 1),
-            ("Pop", 2.34, 0),
-            ("Burger", 3.45, 1),
-        ],
-        order_status=set([
-            main.RestaurantDB.ORDER_PENDING,
-            main.RestaurantDB.ORDER_ACCEPTED,
-            main.RestaurantDB.ORDER_CANCELLED,
-            main.RestaurantDB.ORDER_DELIVERED,
-            main.RestaurantDB.ORDER_PAID,
-        ]),
-        allowed_transitions=set([
-            (main.RestaurantDB.ORDER_PENDING, main.RestaurantDB.ORDER_PAID),
-            (main.RestaurantDB.ORDER_PENDING, main.RestaurantDB.ORDER_CANCELLED),
-            (main.RestaurantDB.ORDER_PAID, main.RestaurantDB.ORDER_CANCELLED),
-        ]),
-    )
-    fail += not test_order_state_transition(
-        "is someone else's order (is an employee)",
+        items=ITEMS,
+        order_status={PEND, ACC, CANC, DEL, PAID},
+        allowed_transitions={
+            (PEND, PAID),
+            (PEND, CANC),
+            (PAID, CANC),
+        },
+    ),
+    dict(
+        name="is someone else's order (is an employee)",
         order_id_exists=True,
         restaurant_is_deleted=False,
         user_owns_order=False,
         user_is_employee=True,
         user_has_billing_info=True,
-        items=[
-            ("Water", 1.23, 1),
-            ("Pop", 2.34, 0),
-            ("Burger", 3.45, 1),
-        ],
-        order_status=set([
-            main.RestaurantDB.ORDER_PENDING,
-            main.RestaurantDB.ORDER_ACCEPTED,
-            main.RestaurantDB.ORDER_CANCELLED,
-            main.RestaurantDB.ORDER_DELIVERED,
-            main.RestaurantDB.ORDER_PAID,
-        ]),
-        allowed_transitions=set([
-            (main.RestaurantDB.ORDER_PAID, main.RestaurantDB.ORDER_ACCEPTED),
-            (main.RestaurantDB.ORDER_ACCEPTED, main.RestaurantDB.ORDER_DELIVERED),
-        ]),
-    )
-    fail += not test_order_state_transition(
-        "is user's order (is an employee)",
+        items=ITEMS,
+        order_status={PEND, ACC, CANC, DEL, PAID},
+        allowed_transitions={
+            (PAID, ACC),
+            (ACC, DEL),
+        },
+    ),
+    dict(
+        name="is user's order (is an employee)",
         order_id_exists=True,
         restaurant_is_deleted=False,
         user_owns_order=True,
         user_is_employee=True,
         user_has_billing_info=True,
-        items=[
-            ("Water", 1.23, 1),
-            ("Pop", 2.34, 0),
-            ("Burger", 3.45, 1),
-        ],
-        order_status=set([
-            main.RestaurantDB.ORDER_PENDING,
-            main.RestaurantDB.ORDER_ACCEPTED,
-            main.RestaurantDB.ORDER_CANCELLED,
-            main.RestaurantDB.ORDER_DELIVERED,
-            main.RestaurantDB.ORDER_PAID,
-        ]),
-        allowed_transitions=set([
+        items=ITEMS,
+        order_status={PEND, ACC, CANC, DEL, PAID},
+        allowed_transitions={
             # since it's their order
-            (main.RestaurantDB.ORDER_PENDING, main.RestaurantDB.ORDER_PAID),
-            (main.RestaurantDB.ORDER_PENDING, main.RestaurantDB.ORDER_CANCELLED),
-            (main.RestaurantDB.ORDER_PAID, main.RestaurantDB.ORDER_CANCELLED),
+            (PEND, PAID),
+            (PEND, CANC),
+            (PAID, CANC),
             # since they're also an employee, they can accept and deliver their own order :p
-            (main.RestaurantDB.ORDER_PAID, main.RestaurantDB.ORDER_ACCEPTED),
-            (main.RestaurantDB.ORDER_ACCEPTED, main.RestaurantDB.ORDER_DELIVERED),
-        ]),
-    )
+            (PAID, ACC),
+            (ACC, DEL),
+        },
+    ),
+]
+
+if __name__ == "__main__":
+    executor = concurrent.futures.ProcessPoolExecutor()
+    checks = [test_order_state_transition(executor, **case) for case in CASES]
+
+    fail = 0
+    for check in checks:
+        fail += not check()
+    executor.shutdown()
 
     print()
     if fail:
         print(f'{fail} tests failed')
     else:
-        print('all tests passed')
\ No newline at end of file
+        print('all tests passed')
@@ -0,0 +1,102 @@
+"""
+Tests for ItemDeltaBatcher, using a fresh database for each test.
+"""
+
+
+import asyncio
+import contextlib
+import sqlite3
+
+import pytest
+
+import main
+
+
+with open("database.sql", "r") as f:
+    _SCHEMA_SQL = f.read()
+
+
+@pytest.fixture
+def db(tmp_path):
+    """
+    A new restaurant database with a customer, a restaurant with two menu
+    items, and two pending orders (ids 1 and 2).
+    """
+    filename = str(tmp_path / "restaurant.db")
+    conn = sqlite3.connect(filename)
+    conn.executescript(_SCHEMA_SQL)
+    conn.close()
+
+    db = main.RestaurantDB(filename)
+    with db.batch():
+        db.create_account("owner", "password", "Test", "Owner")
+        db.create_account("customer", "password", "Test", "Customer")
+        restaurant_id = db.create_restaurant("Test Restaurant", "owner")
+        db.add_menu_items(restaurant_id, [("Water", 123), ("Burger", 345)])
+        db.create_order(restaurant_id, "customer")
+        db.create_order(restaurant_id, "customer")
+    yield db
+    db.close()
+
+
+def quantities(db: main.RestaurantDB, order_id: int) -> dict:
+    return {item["Name"]: item["Quantity"] for item in db.get_order(order_id)["Items"]}
+
+
+async def submit_all(batcher: main.ItemDeltaBatcher, changes: list) -> list:
+    """
+    Submits all of the (order id, item id, delta) changes at once, returning
+    the result (None or the exception) for each one.
+    """
+    return await asyncio.gather(*(batcher.submit(*change) for change in changes), return_exceptions=True)
+
+
+def test_submit_applies_changes(db):
+    batcher = main.ItemDeltaBatcher(db)
+    results = asyncio.run(submit_all(batcher, [(1, 1, 1), (1, 1, 1), (2, 2, 3), (1, 2, 1), (2, 2, -1)]))
+    assert results == [None] * 5
+    assert quantities(db, 1) == {"Water": 2, "Burger": 1}
+    assert quantities(db, 2) == {"Water": 0, "Burger": 2}
+
+
+def test_submit_order_error(db):
+    batcher = main.ItemDeltaBatcher(db)
+    results = asyncio.run(submit_all(batcher, [(1, 1, 1), (99, 1, 1)]))
+    assert results[0] is None
+    assert isinstance(results[1], main.OrderTransitionError)
+    assert quantities(db, 1) == {"Water": 1, "Burger": 0}
+
+
+def test_submit_batch_error(db, monkeypatch):
+    # e.g., BEGIN IMMEDIATE timing out while another connection holds the write lock
+    @contextlib.contextmanager
+    def batch():
+        raise sqlite3.OperationalError("database is locked")
+        yield
+    monkeypatch.setattr(db, "batch", batch)
+
+    batcher = main.ItemDeltaBatcher(db)
+    results = asyncio.run(asyncio.wait_for(submit_all(batcher, [(1, 1, 1), (2, 2, 1)]), timeout=5))
+    assert all(isinstance(result, sqlite3.OperationalError) for result in results)
+
+
+@pytest.mark.parametrize("order_id", [1, 99])
+def test_submit_cancelled(db, order_id):
+    # one of the submits is cancelled while its change is pending (for both a
+    # change which is committed and one which fails), which mustn't stop the
+    # other changes from being resolved
+    async def run():
+        batcher = main.ItemDeltaBatcher(db)
+        cancelled = asyncio.ensure_future(batcher.submit(order_id, 1, 1))
+        other = asyncio.ensure_future(batcher.submit(order_id, 2, 1))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        return await asyncio.wait_for(asyncio.gather(cancelled, other, return_exceptions=True), timeout=5)
+
+    results = asyncio.run(run())
+    assert isinstance(results[0], asyncio.CancelledError)
+    if order_id == 1:
+        assert results[1] is None
+        assert quantities(db, 1) == {"Water": 1, "Burger": 1}  # it was already submitted
+    else:
+        assert isinstance(results[1], main.OrderTransitionError)
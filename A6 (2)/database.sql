@@ -62,4 +62,17 @@ CREATE TABLE "OrderItems" (
 	FOREIGN KEY ("ItemID") REFERENCES MenuItems("ItemID") ON DELETE RESTRICT
 ) STRICT;
 
+-- for listing a restaurant's current menu items
+CREATE INDEX "MenuItemsRestaurant" ON "MenuItems" ("RestaurantID", "Deleted", "ItemID");
+
+-- for listing a restaurant's active orders
+CREATE INDEX "OrdersRestaurantStatus" ON "Orders" ("RestaurantID", "Status");
+
+-- for listing a customer's orders
+CREATE INDEX "OrdersUsername" ON "Orders" ("Username");
+
+-- for the foreign key checks when deleting accounts or menu items
+CREATE INDEX "RestaurantEmployeesUsername" ON "RestaurantEmployees" ("Username");
+CREATE INDEX "OrderItemsItem" ON "OrderItems" ("ItemID");
+
 PRAGMA user_version = 1;
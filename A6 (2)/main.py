@@ -25,28 +25,142 @@ Input and output:
 """
 
 import asyncio
+import collections
+import concurrent.futures
+import contextlib
 import datetime
 import hashlib
-import json
+import hmac
 import os
+import pickle
+import queue
+import re
+import secrets
 import sqlite3
+import tempfile
+import threading
 import tornado
+import urllib.request
 import yaml
 
-from typing import Optional, Awaitable, List, Tuple
+from typing import Optional, Awaitable, Iterator, List, Tuple
 
 from validate import *
 
 class OrderTransitionError(Exception):
     pass
 
+# use libyaml's parser if PyYAML was built with it
+try:
+    from yaml import CSafeLoader as _YAMLLoader
+except ImportError:
+    from yaml import SafeLoader as _YAMLLoader
+
+def load_yaml(filename: str):
+    """
+    Loads a YAML data file, caching the parsed data in a pickle next to it
+    (which is used until the YAML file is changed).
+    """
+    st = os.stat(filename)
+    cache = filename + ".pkl"
+    try:
+        with open(cache, "rb") as f:
+            mtime, size, data = pickle.load(f)
+        if (mtime, size) == (st.st_mtime_ns, st.st_size):
+            return data
+    except Exception:
+        pass  # missing or corrupt, so parse the YAML again
+    with open(filename, "r") as f:
+        data = yaml.load(f, Loader=_YAMLLoader)
+    try:
+        # written to a unique temporary file first, since several processes
+        # (e.g., the main_test servers) may be writing the cache at once
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(cache) or ".", prefix=os.path.basename(cache) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump((st.st_mtime_ns, st.st_size, data), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, cache)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    except OSError:
+        pass  # it's just a cache
+    return data
+
+# queries for the RestaurantDB read methods (the connection caches the prepared
+# statements by their text, so these only get parsed once per connection)
+_SQL_GET_USER_INFO = "SELECT Username, FirstName, LastName FROM Accounts WHERE Username = ?"
+_SQL_GET_USER_PASSWORD = "SELECT PasswordSHA256 FROM Accounts WHERE Username = ?"
+_SQL_GET_RESTAURANTS = "SELECT RestaurantID, Owner, Name FROM Restaurants WHERE DELETED <> TRUE"
+_SQL_GET_RESTAURANT = "SELECT RestaurantID, Owner, Name FROM Restaurants WHERE Deleted <> TRUE AND RestaurantID = ?"
+_SQL_GET_RESTAURANT_PAGE = "SELECT RestaurantID, Owner, Name, Owner = ? AS IsUserOwner, EXISTS (SELECT 1 FROM RestaurantEmployees WHERE RestaurantEmployees.RestaurantID = Restaurants.RestaurantID AND Username = ?) AS IsUserEmployee FROM Restaurants WHERE Deleted <> TRUE AND RestaurantID = ?"
+_SQL_GET_MENU_ITEMS = "SELECT ItemID, Name, Price FROM MenuItems WHERE Deleted <> TRUE AND RestaurantID = ?"
+_SQL_GET_USER_ROLES = "SELECT EXISTS (SELECT 1 FROM Restaurants WHERE RestaurantID = ? AND Owner = ?), EXISTS (SELECT 1 FROM RestaurantEmployees WHERE RestaurantID = ? AND Username = ?)"
+_SQL_GET_RESTAURANT_ACTIVE_ORDERS = "SELECT OrderID, Date AS 'Date [timestamp]', Username, Address, Total, Status FROM Orders WHERE RestaurantID = ? AND Status IN ('PAID','ACCEPTED')"
+_SQL_GET_RESTAURANT_EMPLOYEES = "SELECT Username FROM RestaurantEmployees WHERE RestaurantID = ?"
+_SQL_GET_ACCOUNT_DETAILS = "SELECT Username, FirstName, LastName, Address, CardNumber, CardExpiry, CardCode FROM Accounts WHERE Username = ?"
+_SQL_GET_USER_ORDERS = "SELECT Orders.OrderID, Orders.Date AS 'Date [timestamp]', Orders.RestaurantID, Restaurants.Name AS RestaurantName, Orders.Username, Orders.Address, Orders.Total, Orders.Status FROM Orders LEFT JOIN Restaurants ON Orders.RestaurantID = Restaurants.RestaurantID WHERE Username = ?"
+_SQL_GET_ORDER = "SELECT Orders.OrderID, Orders.Date AS 'Date [timestamp]', Orders.RestaurantID, Restaurants.Name AS RestaurantName, Orders.Username, Orders.Address, Orders.Total, Orders.Status, MenuItems.ItemID, MenuItems.Name, MenuItems.Price, COALESCE(OrderItems.Quantity, 0) AS Quantity FROM Orders LEFT JOIN Restaurants ON Restaurants.RestaurantID = Orders.RestaurantID LEFT JOIN MenuItems ON (Orders.Status = 'PENDING' AND MenuItems.RestaurantID = Orders.RestaurantID AND MenuItems.Deleted <> TRUE) OR (Orders.Status <> 'PENDING' AND MenuItems.ItemID IN (SELECT ItemID FROM OrderItems WHERE OrderItems.OrderID = Orders.OrderID)) LEFT JOIN OrderItems ON OrderItems.OrderID = Orders.OrderID AND OrderItems.ItemID = MenuItems.ItemID WHERE Orders.OrderID = ? ORDER BY MenuItems.ItemID"
+_SQL_GET_ORDER_CUSTOMER = "SELECT Username FROM Orders WHERE OrderID = ?"
+_SQL_IS_USER_OWNER = "SELECT EXISTS (SELECT 1 FROM Restaurants WHERE RestaurantID = ? AND Owner = ?)"
+_SQL_IS_USER_EMPLOYEE = "SELECT EXISTS (SELECT 1 FROM RestaurantEmployees WHERE RestaurantID = ? AND Username = ?)"
+
+# whether a restaurant exists and hasn't been deleted (checked before most changes to one)
+_SQL_RESTAURANT_EXISTS = "SELECT EXISTS (SELECT 1 FROM Restaurants WHERE RestaurantID = ? AND Deleted <> TRUE)"
+
+# statements for the order and menu item changes
+_SQL_GET_ORDER_FOR_TRANSITION = "SELECT Orders.RestaurantID, Orders.Username, Orders.Status, Restaurants.Deleted, Accounts.Address, Accounts.CardNumber, Accounts.CardExpiry, Accounts.CardCode FROM Orders LEFT JOIN Restaurants ON Restaurants.RestaurantID = Orders.RestaurantID LEFT JOIN Accounts ON Accounts.Username = Orders.Username WHERE Orders.OrderID = ? AND (? IS NULL OR Orders.RestaurantID = ?)"
+_SQL_GET_ORDER_TOTAL = "SELECT COALESCE(SUM(MenuItems.Price * OrderItems.Quantity), 0), COUNT(*), MAX(MenuItems.RestaurantID <> ? OR MenuItems.Deleted) FROM OrderItems JOIN MenuItems ON MenuItems.ItemID = OrderItems.ItemID WHERE OrderItems.OrderID = ? AND OrderItems.Quantity > 0"
+_SQL_GET_ORDER_BAD_ITEM = "SELECT MenuItems.Name, MenuItems.RestaurantID <> ? FROM OrderItems JOIN MenuItems ON MenuItems.ItemID = OrderItems.ItemID WHERE OrderItems.OrderID = ? AND OrderItems.Quantity > 0 AND (MenuItems.RestaurantID <> ? OR MenuItems.Deleted) ORDER BY OrderItems.ItemID LIMIT 1"
+_SQL_GET_ORDER_STATUS = "SELECT Status FROM Orders WHERE OrderID = ?"
+_SQL_UPDATE_ORDER_BILLING = "UPDATE Orders SET Address = ?, Total = ? WHERE OrderID = ?"
+_SQL_UPDATE_ORDER_STATUS = "UPDATE Orders SET Status = ? WHERE OrderID = ?"
+_SQL_CREATE_ORDER = "INSERT INTO Orders (RestaurantID, Username, Date) SELECT RestaurantID, ?, ? FROM Restaurants WHERE RestaurantID = ? AND Deleted <> TRUE RETURNING OrderID"
+_SQL_MODIFY_ORDER_ITEM = "INSERT INTO OrderItems (OrderID, ItemID, Quantity) VALUES (?, ?, MAX(0, ?)) ON CONFLICT (OrderID, ItemID) DO UPDATE SET Quantity = MAX(0, OrderItems.Quantity + ?)"
+_SQL_ADD_MENU_ITEM = "INSERT INTO MenuItems (RestaurantID, Name, Price) SELECT RestaurantID, ?, ? FROM Restaurants WHERE RestaurantID = ? AND Deleted <> TRUE RETURNING ItemID"
+_SQL_ADD_MENU_ITEMS = "INSERT INTO MenuItems (RestaurantID, Name, Price) VALUES (?, ?, ?)"
+_SQL_GET_NEW_MENU_ITEM_IDS = "SELECT ItemID FROM MenuItems WHERE RestaurantID = ? ORDER BY ItemID DESC LIMIT ?"
+_SQL_UPDATE_MENU_ITEM = "UPDATE MenuItems SET Name = ?, Price = ? WHERE RestaurantID = ? AND ItemID = ?"
+_SQL_DELETE_MENU_ITEM = "UPDATE MenuItems SET Deleted = TRUE WHERE RestaurantID = ? AND ItemID = ?"
+
+# statements for the account, restaurant, and employee changes
+_SQL_CREATE_ACCOUNT = "INSERT INTO Accounts (Username, PasswordSHA256, FirstName, LastName) VALUES (?, ?, ?, ?) ON CONFLICT (Username) DO NOTHING"
+_SQL_UPDATE_ACCOUNT = "UPDATE Accounts SET FirstName = ?, LastName = ?, Address = ?, CardNumber = ?, CardExpiry = ?, CardCode = ?, PasswordSHA256 = COALESCE(?, PasswordSHA256) WHERE Username = ?"
+_SQL_ACCOUNT_EXISTS = "SELECT EXISTS (SELECT 1 FROM Accounts WHERE Username = ?)"
+_SQL_CREATE_RESTAURANT = "INSERT INTO Restaurants (Name, Owner) VALUES (?, ?) RETURNING RestaurantID"
+_SQL_ADD_RESTAURANT_OWNER = "INSERT INTO RestaurantEmployees (RestaurantID, Username) VALUES (?, ?)"
+_SQL_UPDATE_RESTAURANT_NAME = "UPDATE Restaurants SET Name = ? WHERE RestaurantID = ? AND Deleted <> TRUE"
+_SQL_DELETE_RESTAURANT = "UPDATE Restaurants SET Deleted = TRUE WHERE RestaurantID = ?"
+_SQL_ADD_RESTAURANT_EMPLOYEE = "INSERT INTO RestaurantEmployees (RestaurantID, Username) VALUES (?, ?) ON CONFLICT (RestaurantID, Username) DO NOTHING"
+_SQL_REMOVE_RESTAURANT_EMPLOYEE = "DELETE FROM RestaurantEmployees WHERE RestaurantID = ? AND Username = ?"
+
+def _tune_connection(conn: sqlite3.Connection, journal_mode: Optional[str] = "WAL") -> None:
+    """
+    Sets the performance pragmas for a connection to the restaurant database
+    (pass None as the journal mode for read-only connections).
+    """
+    if journal_mode is not None:
+        # with the write-ahead log, commits only need a sequential append (synced at checkpoints), and readers don't block on writers
+        conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+        conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA mmap_size = 268435456")  # 256 MiB
+    conn.execute("PRAGMA cache_size = -65536")  # 64 MiB
+
 class RestaurantDB:
     """
     Provides access to the restaurant database.
 
     Note: The way Python's sqlite3 module handles transactions is a bit screwy,
-    but in general, it always keeps a transaction open, and will commit or start
-    a new one when requested...
+    so the connection is in autocommit mode, and we start the transactions
+    ourselves (see batch and _transaction). Methods which only run a single
+    statement don't need one, since the statement is atomic by itself.
+
+    Note: All writes come from the handlers on the IOLoop thread, so they're
+    already serialized, and in WAL mode with synchronous=NORMAL a commit doesn't
+    wait for an fsync (only checkpoints do). If something needs to make many
+    changes at once, it should group them with batch() so they're committed
+    together.
     """
 
     """Order status: created by the customer, still editable, not visible to restaurant"""
@@ -64,198 +178,300 @@ class RestaurantDB:
     """Order status: delivered by the restaurant, can no longer be cancelled or edited, not visible to restaurant"""
     ORDER_DELIVERED = "DELIVERED"
 
-    def __init__(self, filename: str):
-        self.conn = sqlite3.connect(filename, detect_types=sqlite3.PARSE_COLNAMES)
+    def __init__(self, filename: str, uri: bool = False, journal_mode: str = "WAL", readers: int = 0):
+        self.conn = sqlite3.connect(filename, detect_types=sqlite3.PARSE_COLNAMES, cached_statements=256, uri=uri, timeout=5.0, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row  # rows can still be unpacked and indexed like tuples
 
         self.conn.execute("PRAGMA foreign_keys = 1")  # enforce foreign key constraints
 
         if self.conn.execute("PRAGMA user_version").fetchone()[0] != 1:
             raise Exception("incorrect database version; please (re)initialize the database")
 
+        _tune_connection(self.conn, journal_mode)
+
+        self._batch = False
+
+        # the main connection can only be used by the thread which opened it,
+        # so reads from other threads get one of the read-only connections
+        # instead (which can run at the same time, since we're using WAL)
+        self._owner = threading.get_ident()
+        self._local = threading.local()
+        self._readers = queue.SimpleQueue()
+        self._reader_count = readers
+        self._executor = concurrent.futures.ThreadPoolExecutor(readers, thread_name_prefix="db-reader") if readers else None  # one thread per read-only connection, so they never wait for one
+        if readers:
+            reader_uri = filename if uri else "file:" + urllib.request.pathname2url(os.path.abspath(filename))
+            reader_uri += ("&" if "?" in reader_uri else "?") + "mode=ro"
+            for _ in range(readers):
+                conn = sqlite3.connect(reader_uri, detect_types=sqlite3.PARSE_COLNAMES, cached_statements=256, uri=True, timeout=5.0, isolation_level=None, check_same_thread=False)
+                conn.row_factory = sqlite3.Row
+                _tune_connection(conn, None)
+                self._readers.put(conn)
+
     def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+        for _ in range(self._reader_count):
+            self._readers.get().close()
+        self.conn.execute("PRAGMA optimize")  # update the planner statistics if the queries we ran would benefit from it
         self.conn.close()
 
-    def get_user_info(self, username: str) -> Optional[Tuple[str, str, str]]:
+    async def read(self, method, *args):
+        """
+        Runs a read method (e.g., db.read(db.get_order, id)) on one of the
+        reader threads so it doesn't block the event loop, or directly if there
+        aren't any read-only connections.
+        """
+        if self._executor is None:
+            return method(*args)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, method, *args)
+
+    @contextlib.contextmanager
+    def _read(self) -> Iterator[sqlite3.Connection]:
+        """
+        Gets the connection to run read-only queries on. This is the main
+        connection if we're on the thread which owns it (so the reads see any
+        changes made in the current transaction), or a read-only one from the
+        pool otherwise (waiting for one to be free if necessary).
+        """
+        if threading.get_ident() == self._owner or not self._reader_count:
+            yield self.conn
+            return
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            yield conn  # nested read on the same thread
+            return
+        conn = self._readers.get()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._readers.put(conn)
+
+    @contextlib.contextmanager
+    def batch(self) -> Iterator[None]:
+        """
+        Groups all changes made inside the block into a single transaction,
+        which is committed at the end of the block (or rolled back if an
+        exception is raised).
+        """
+        if self._batch:
+            yield
+            return
+        self.conn.execute("BEGIN IMMEDIATE")
+        self._batch = True
+        try:
+            yield
+        except BaseException:
+            self.conn.rollback()
+            raise
+        else:
+            self.conn.commit()
+        finally:
+            self._batch = False
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[None]:
+        """
+        Runs the block in its own transaction, or in a savepoint if we're
+        inside a batch (so it can still be undone on its own if it fails).
+        """
+        if not self._batch:
+            with self.batch():
+                yield
+            return
+        self.conn.execute("SAVEPOINT change")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK TO change")
+            raise
+        finally:
+            self.conn.execute("RELEASE change")
+
+    def get_user_info(self, username: str) -> Optional[sqlite3.Row]:
         """
         Returns the username, first name, and lastname of the provided user if
         it exists, or None otherwise.
         """
-        return self.conn.execute("SELECT Username, FirstName, LastName FROM Accounts WHERE Username = ?", (username,)).fetchone()
+        with self._read() as conn:
+            return conn.execute(_SQL_GET_USER_INFO, (username,)).fetchone()
 
     def get_user_password(self, username: str) -> Optional[str]:
         """
         Gets the SHA256 password hash for the provided user if it exists.
         """
-        for (PasswordSHA256,) in self.conn.execute("SELECT PasswordSHA256 FROM Accounts WHERE Username = ?", (username,)):
-            return PasswordSHA256
-        return None
+        with self._read() as conn:
+            for (PasswordSHA256,) in conn.execute(_SQL_GET_USER_PASSWORD, (username,)):
+                return PasswordSHA256
+            return None
 
     def get_restaurants(self) -> List[dict]:
         """
         Get all restaurants.
         """
-        restaurants = []
-        for (ResturantID, Owner, Name) in self.conn.execute("SELECT RestaurantID, Owner, Name FROM Restaurants WHERE DELETED <> TRUE"):
-            restaurants.append({
-                "RestaurantID": int(ResturantID),
-                "Owner": Owner,
-                "Name": Name,
-            })
-        return restaurants
+        with self._read() as conn:
+            return [dict(row) for row in conn.execute(_SQL_GET_RESTAURANTS)]
 
     def get_restaurant(self, id: int) -> Optional[dict]:
         """
         Get a restaurant by its ID, or None if it does not exist.
         """
-        for (ResturantID, Owner, Name) in self.conn.execute("SELECT RestaurantID, Owner, Name FROM Restaurants WHERE Deleted <> TRUE AND RestaurantID = ?", (id,)):
-            return {
-                "RestaurantID": int(ResturantID),
-                "Owner": Owner,
-                "Name": Name,
-            }
-        return None
+        with self._read() as conn:
+            for row in conn.execute(_SQL_GET_RESTAURANT, (id,)):
+                return dict(row)
+            return None
+
+    def get_restaurant_page(self, id: int, username: Optional[str]) -> Optional[dict]:
+        """
+        Get a restaurant by its ID along with its menu items and whether the
+        specified username (if any) is the owner or an employee of it, or None
+        if it does not exist.
+        """
+        with self._read() as conn:
+            for row in conn.execute(_SQL_GET_RESTAURANT_PAGE, (username, username, id)):
+                return {
+                    "Restaurant": {
+                        "RestaurantID": row["RestaurantID"],
+                        "Owner": row["Owner"],
+                        "Name": row["Name"],
+                    },
+                    "MenuItems": self.get_menu_items(id),
+                    "IsUserOwner": bool(row["IsUserOwner"]),
+                    "IsUserEmployee": bool(row["IsUserEmployee"]),
+                }
+            return None
 
     def get_menu_items(self, id: int) -> List[dict]:
         """
         Get all menu items for a restaurant.
         """
-        items = []
-        for (ItemID, Name, Price) in self.conn.execute("SELECT ItemID, Name, Price FROM MenuItems WHERE Deleted <> TRUE AND RestaurantID = ?", (id,)):
-            items.append({
-                "ItemID": int(ItemID),
-                "Name": Name,
-                "Price": int(Price),
-            })
-        return items
+        with self._read() as conn:
+            return [dict(row) for row in conn.execute(_SQL_GET_MENU_ITEMS, (id,))]
 
     def is_user_owner(self, id: int, username: int) -> bool:
         """
         Returns true if the specified username is the owner of the specified
         restaurant.
         """
-        return self.conn.execute("SELECT RestaurantID FROM Restaurants WHERE RestaurantID = ? AND Owner = ?", (id, username)).fetchone() is not None
+        with self._read() as conn:
+            return bool(conn.execute(_SQL_IS_USER_OWNER, (id, username)).fetchone()[0])
 
     def is_user_employee(self, id: int, username: int) -> bool:
         """
         Returns true if the specified username is an employee of the specified
         restaurant.
         """
-        return self.conn.execute("SELECT RestaurantID FROM RestaurantEmployees WHERE RestaurantID = ? AND Username = ?", (id, username)).fetchone() is not None
+        with self._read() as conn:
+            return bool(conn.execute(_SQL_IS_USER_EMPLOYEE, (id, username)).fetchone()[0])
+
+    def get_user_roles(self, id: int, username: str) -> Tuple[bool, bool]:
+        """
+        Returns whether the specified username is the (owner, employee) of the
+        specified restaurant, in a single query.
+        """
+        with self._read() as conn:
+            is_owner, is_employee = conn.execute(_SQL_GET_USER_ROLES, (id, username, id, username)).fetchone()
+            return bool(is_owner), bool(is_employee)
 
     def get_restaurant_active_orders(self, id: int) -> List[dict]:
         """
         Get active (i.e., not pending/delivered/cancelled) orders.
         """
-        orders = []
-        for (OrderID, Date, Username, Address, Total, Status) in self.conn.execute("SELECT OrderID, Date AS 'Date [timestamp]', Username, Address, Total, Status FROM Orders WHERE RestaurantID = ? AND Status IN ('PAID','ACCEPTED')", (id,)):
-            assert isinstance(Date, datetime.datetime)
-            orders.append({
-                "OrderID": int(OrderID),
-                "Date": Date,
-                "Username": Username,
-                "Address": Address,
-                "Total": int(Total),
-                "Status": Status,
-            })
-        return orders
+        with self._read() as conn:
+            orders = []
+            for row in conn.execute(_SQL_GET_RESTAURANT_ACTIVE_ORDERS, (id,)):
+                assert isinstance(row["Date"], datetime.datetime)
+                orders.append(dict(row))
+            return orders
 
     def get_restaurant_employees(self, id: int) -> List[str]:
         """
         Get all employee usernames for the specified restaurant.
         """
-        usernames = []
-        for (Username,) in self.conn.execute("SELECT Username FROM RestaurantEmployees WHERE RestaurantID = ?", (id,)):
-            usernames.append(Username)
-        return usernames
+        with self._read() as conn:
+            usernames = []
+            for (Username,) in conn.execute(_SQL_GET_RESTAURANT_EMPLOYEES, (id,)):
+                usernames.append(Username)
+            return usernames
 
     def get_account_details(self, username: str) -> Optional[dict]:
         """
         Get the account details for the specified username if it exists.
         """
-        for (Username, FirstName, LastName, Address, CardNumber, CardExpiry, CardCode) in self.conn.execute("SELECT Username, FirstName, LastName, Address, CardNumber, CardExpiry, CardCode FROM Accounts WHERE Username = ?", (username,)):
-            return {
-                "Username": Username,
-                "FirstName": FirstName,
-                "LastName": LastName,
-                "Address": Address,
-                "CardNumber": CardNumber,
-                "CardExpiry": CardExpiry,
-                "CardCode": CardCode,
-            }
-        return None
+        with self._read() as conn:
+            for row in conn.execute(_SQL_GET_ACCOUNT_DETAILS, (username,)):
+                return dict(row)
+            return None
 
-    def get_user_orders(self, username: str) -> List[str]:
+    def get_user_orders(self, username: str) -> List[dict]:
         """
         Get user orders if the username exists.
         """
-        orders = []
-        for (OrderID, Date, RestaurantID, RestaurantName, Username, Address, Total, Status) in self.conn.execute("SELECT Orders.OrderID, Orders.Date AS 'Date [timestamp]', Orders.RestaurantID, Restaurants.Name AS RestaurantName, Orders.Username, Orders.Address, Orders.Total, Orders.Status FROM Orders LEFT JOIN Restaurants ON Orders.RestaurantID = Restaurants.RestaurantID WHERE Username = ?", (username,)):
-            assert isinstance(Date, datetime.datetime)
-            orders.append({
-                "OrderID": int(OrderID),
-                "Date": Date,
-                "RestaurantID": RestaurantID,
-                "RestaurantName": RestaurantName,
-                "Username": Username,
-                "Address": Address,
-                "Total": int(Total),
-                "Status": Status,
-            })
-        return orders
+        with self._read() as conn:
+            orders = []
+            for row in conn.execute(_SQL_GET_USER_ORDERS, (username,)):
+                assert isinstance(row["Date"], datetime.datetime)
+                orders.append(dict(row))
+            return orders
 
     def get_order(self, id: int) -> Optional[dict]:
         """
         Get order information and all valid menu items for the specified order
         if it exists.
         """
-        for (OrderID, Date, RestaurantID, RestaurantName, Username, Address, Total, Status) in self.conn.execute("SELECT Orders.OrderID, Orders.Date AS 'Date [timestamp]', Orders.RestaurantID, Restaurants.Name AS RestaurantName, Orders.Username, Orders.Address, Orders.Total, Orders.Status FROM Orders LEFT JOIN Restaurants ON Restaurants.RestaurantID = Orders.RestaurantID WHERE OrderID = ?", (id,)):
-            assert isinstance(Date, datetime.datetime)
-            order = {
-                "OrderID": OrderID,
-                "Date": Date,
-                "RestaurantID": RestaurantID,
-                "RestaurantName": RestaurantName,
-                "Username": Username,
-                "Address": Address,
-                "Total": int(Total),
-                "Status": Status,
-                "Items": [],
-            }
-            if Status == RestaurantDB.ORDER_PENDING:
-                for (ItemID, Name, Price, Quantity) in self.conn.execute("SELECT MenuItems.ItemID, Name, Price, Quantity FROM MenuItems LEFT JOIN OrderItems ON MenuItems.ItemID = OrderItems.ItemID AND OrderItems.OrderID = ? WHERE MenuItems.RestaurantID = ? AND MenuItems.Deleted <> TRUE", (OrderID, RestaurantID)):
+        with self._read() as conn:
+            # pending orders show all of the restaurant's current menu items (with the quantity, if any), other ones show the items which were ordered
+            order = None
+            for row in conn.execute(_SQL_GET_ORDER, (id,)):
+                if order is None:
+                    assert isinstance(row["Date"], datetime.datetime)
+                    order = {
+                        "OrderID": row["OrderID"],
+                        "Date": row["Date"],
+                        "RestaurantID": row["RestaurantID"],
+                        "RestaurantName": row["RestaurantName"],
+                        "Username": row["Username"],
+                        "Address": row["Address"],
+                        "Total": row["Total"],
+                        "Status": row["Status"],
+                        "Items": [],
+                    }
+                if row["ItemID"] is None:
+                    continue
+                if order["Status"] == RestaurantDB.ORDER_PENDING:
                     order["Items"].append({
-                        "ItemID": int(ItemID),
-                        "Name": Name,
-                        "Price": int(Price),
-                        "Quantity": int(Quantity or 0),
+                        "ItemID": row["ItemID"],
+                        "Name": row["Name"],
+                        "Price": row["Price"],
+                        "Quantity": row["Quantity"],
                     })
-            else:
-                for (ItemID, Name, Quantity) in self.conn.execute("SELECT OrderItems.ItemID, Name, Quantity FROM OrderItems LEFT JOIN MenuItems ON MenuItems.ItemID = OrderItems.ItemID WHERE OrderItems.OrderID = ?", (OrderID,)):
+                else:
                     order["Items"].append({
-                        "ItemID": int(ItemID),
-                        "Name": Name,
-                        "Quantity": int(Quantity),
+                        "ItemID": row["ItemID"],
+                        "Name": row["Name"],
+                        "Quantity": row["Quantity"],
                     })
             return order
-        return None
 
     def get_order_customer(self, order_id: int) -> Optional[str]:
         """
         Get the order username if the order exists.
         """
-        for (Username,) in self.conn.execute("SELECT Username FROM Orders WHERE OrderID = ?", (order_id,)):
-            return Username
-        return None
+        with self._read() as conn:
+            for (Username,) in conn.execute(_SQL_GET_ORDER_CUSTOMER, (order_id,)):
+                return Username
+            return None
 
     def create_restaurant(self, name: str, owner: str) -> int:
         """
         Creates a restaurant with the specified name and owner, and adds the
         owner as an employee, returning the new restaurant id.
         """
-        with self.conn:
-            restaurant_id = self.conn.execute("INSERT INTO Restaurants (Name, Owner) VALUES (?, ?) RETURNING RestaurantID", (name, owner)).fetchone()[0]
-            self.conn.execute("INSERT INTO RestaurantEmployees (RestaurantID, Username) VALUES (?, ?)", (restaurant_id, owner))
-            self.conn.commit()
+        with self._transaction():
+            restaurant_id = self.conn.execute(_SQL_CREATE_RESTAURANT, (name, owner)).fetchone()[0]
+            self.conn.execute(_SQL_ADD_RESTAURANT_OWNER, (restaurant_id, owner))
             return restaurant_id
 
     def create_account(self, username: str, password: str, first_name: str, last_name: str) -> None:
@@ -263,31 +479,22 @@ class RestaurantDB:
         Creates an account with the specified username and password, returning
         True if the account is new.
         """
-        sha = hashlib.sha256()
-        sha.update(password.encode("utf-8"))
-        sha = sha.hexdigest()
-        with self.conn:
-            cursor = self.conn.execute("INSERT INTO Accounts (Username, PasswordSHA256, FirstName, LastName) VALUES (?, ?, ?, ?) ON CONFLICT (Username) DO NOTHING", (username, sha, first_name, last_name))
-            self.conn.commit()
-            return cursor.rowcount == 1
+        cursor = self.conn.execute(_SQL_CREATE_ACCOUNT, (username, hashlib.sha256(password.encode("utf-8")).hexdigest(), first_name, last_name))
+        return cursor.rowcount == 1
 
     def transition_order(self, username: str, restaurant_id: Optional[int], order_id: int, status: str) -> None:
         """
         Transitions the order status, validating all permissions and conditions,
         raising an exception if something isn't right.
         """
-        with self.conn:
-            row = None
-            if restaurant_id is None:
-                row = self.conn.execute("SELECT RestaurantID, Username, Status from Orders WHERE OrderID = ?", (order_id,)).fetchone()
-            else:
-                row = self.conn.execute("SELECT RestaurantID, Username, Status from Orders WHERE RestaurantID = ? AND OrderID = ?", (restaurant_id, order_id)).fetchone()
+        with self._transaction():
+            # get the order along with its restaurant and the customer's billing information in one go
+            row = self.conn.execute(_SQL_GET_ORDER_FOR_TRANSITION, (order_id, restaurant_id, restaurant_id)).fetchone()
             if not row:
                 raise OrderTransitionError(f"no such order {order_id} for restaurant {restaurant_id}")
-            order_restaurant_id, order_username, order_status = row
-            order_restaurant_id = int(order_restaurant_id)
+            order_restaurant_id, order_username, order_status, restaurant_deleted, acct_address, acct_card, acct_card_expiry, acct_card_code = row
 
-            if self.conn.execute("SELECT RestaurantID FROM Restaurants WHERE RestaurantID = ? AND Deleted <> TRUE", (order_restaurant_id,)).fetchone() is None:
+            if restaurant_deleted is None or restaurant_deleted:
                 raise OrderTransitionError(f"restaurant does not exist or has been deleted")
 
             if order_status == RestaurantDB.ORDER_PENDING:
@@ -295,26 +502,22 @@ class RestaurantDB:
                     if order_username != username:
                         raise OrderTransitionError("cannot pay for someone else's order")
 
-                    row = self.conn.execute("SELECT Address, CardNumber, CardExpiry, CardCode FROM Accounts WHERE Username = ? AND Address <> '' AND CardNumber <> '' AND CardExpiry <> '' AND CardCode <> ''", (order_username,)).fetchone()
-                    if not row:
+                    if not (acct_address and acct_card and acct_card_expiry and acct_card_code):
                         raise OrderTransitionError("cannot pay for order without address and billing information set for account")
-                    acct_address, acct_card, acct_card_expiry, acct_card_code = row
-
-                    total = 0
-                    items = 0
-                    for (ItemID, Quantity, RestaurantID, ItemName, Price, Deleted) in self.conn.execute("SELECT OrderItems.ItemID, OrderItems.Quantity, MenuItems.RestaurantID, MenuItems.Name, MenuItems.Price, MenuItems.Deleted FROM OrderItems LEFT JOIN MenuItems ON MenuItems.ItemID = OrderItems.ItemID WHERE OrderItems.OrderID = ?", (order_id,)):
-                        if int(Quantity) > 0:
-                            if int(RestaurantID) != order_restaurant_id:
-                                raise OrderTransitionError(f"order contains item {ItemName} from another restaurant (wtf... are you messing with the requests or the database)")
-                            if bool(Deleted):
-                                raise OrderTransitionError(f"cannot order deleted item {ItemName}")
-                            total += int(Price) * int(Quantity)
-                            items += 1
+
+                    total, items, bad = self.conn.execute(_SQL_GET_ORDER_TOTAL, (order_restaurant_id, order_id)).fetchone()
+
+                    # only look for the first bad item (for the error message) if there is one
+                    if bad:
+                        ItemName, OtherRestaurant = self.conn.execute(_SQL_GET_ORDER_BAD_ITEM, (order_restaurant_id, order_id, order_restaurant_id)).fetchone()
+                        if OtherRestaurant:
+                            raise OrderTransitionError(f"order contains item {ItemName} from another restaurant (wtf... are you messing with the requests or the database)")
+                        raise OrderTransitionError(f"cannot order deleted item {ItemName}")
 
                     if items == 0:
                         raise OrderTransitionError(f"order must contain at least one item")
 
-                    self.conn.execute("UPDATE Orders SET Address = ?, Total = ? WHERE OrderID = ?", (acct_address, total, order_id))
+                    self.conn.execute(_SQL_UPDATE_ORDER_BILLING, (acct_address, total, order_id))
                     # okay, fallthrough (customer: PENDING -> PAID, with valid billing information)
 
                 elif status == RestaurantDB.ORDER_CANCELLED:
@@ -355,26 +558,31 @@ class RestaurantDB:
             else:
                 raise AssertionError(f"invalid order status {order_status} from database")
 
-            self.conn.execute("UPDATE Orders SET Status = ? WHERE OrderID = ?", (status, order_id))
-            self.conn.commit()
+            self.conn.execute(_SQL_UPDATE_ORDER_STATUS, (status, order_id))
 
     def create_order(self, restaurant_id: int, username: str) -> int:
         """
         Creates an order for the specified user and returns the ID.
         """
-        with self.conn:
-            if self.conn.execute("SELECT RestaurantID FROM Restaurants WHERE RestaurantID = ? AND Deleted <> TRUE", (restaurant_id,)).fetchone() is None:
-                raise OrderTransitionError(f"restaurant does not exist or has been deleted")
-            order_id = self.conn.execute("INSERT INTO Orders (RestaurantID, Username, Date) VALUES (?, ?, ?) RETURNING OrderID", (restaurant_id, username, datetime.datetime.now())).fetchone()[0]
-            self.conn.commit()
-            return order_id
+        # only inserts the order if the restaurant exists and hasn't been deleted
+        row = self.conn.execute(_SQL_CREATE_ORDER, (username, datetime.datetime.now(), restaurant_id)).fetchone()
+        if row is None:
+            raise OrderTransitionError(f"restaurant does not exist or has been deleted")
+        return row[0]
 
     def modify_order_item(self, order_id: int, item_id: int, delta: int) -> None:
         """
         Update the quantity of an item in an order.
         """
-        with self.conn:
-            row = self.conn.execute("SELECT Status FROM Orders WHERE OrderID = ?", (order_id,)).fetchone()
+        self.modify_order_items(order_id, [(item_id, delta)])
+
+    def modify_order_items(self, order_id: int, deltas: List[Tuple[int, int]]) -> None:
+        """
+        Update the quantities of multiple (item_id, delta) items in an order at
+        once, in order.
+        """
+        with self._transaction():
+            row = self.conn.execute(_SQL_GET_ORDER_STATUS, (order_id,)).fetchone()
             if row is None:
                 raise OrderTransitionError(f"order {order_id} does not exist")
 
@@ -384,77 +592,80 @@ class RestaurantDB:
 
             # note: the webapp won't show options to add bad items (and we validate that the item is for the correct restaurant when paying for the order), so we don't have to do it here
 
-            self.conn.execute("INSERT INTO OrderItems (OrderID, ItemID) VALUES (?, ?) ON CONFLICT (OrderID, ItemID) DO NOTHING", (order_id, item_id))
-            self.conn.execute("UPDATE OrderItems SET Quantity = MAX(0, Quantity + ?) WHERE OrderID = ? AND ItemID = ?", (delta, order_id, item_id))
-            self.conn.commit()
+            # the deltas are applied in order, so repeated items still clamp at each step
+            self.conn.executemany(_SQL_MODIFY_ORDER_ITEM, [(order_id, item_id, delta, delta) for item_id, delta in deltas])
 
     def update_restaurant_name(self, id: int, name: str) -> None:
         """
         Updates the restaurant name if the restaurant exists.
         """
-        with self.conn:
-            self.conn.execute("UPDATE Restaurants SET Name = ? WHERE RestaurantID = ? AND Deleted <> TRUE", (name, id))
-            self.conn.commit()
+        self.conn.execute(_SQL_UPDATE_RESTAURANT_NAME, (name, id))
 
     def delete_restaurant(self, id: int) -> None:
         """
         Marks a restaurant as deleted if it exists.
         """
-        with self.conn:
-            self.conn.execute("UPDATE Restaurants SET Deleted = TRUE WHERE RestaurantID = ?", (id,))
-            self.conn.commit()
+        self.conn.execute(_SQL_DELETE_RESTAURANT, (id,))
 
     def remove_restaurant_employee(self, id: int, username: str) -> None:
         """
         Removes an employee from a restaurant if it exists.
         """
-        with self.conn:
-            self.conn.execute("DELETE FROM RestaurantEmployees WHERE RestaurantID = ? AND Username = ?", (id, username))
-            self.conn.commit()
+        self.conn.execute(_SQL_REMOVE_RESTAURANT_EMPLOYEE, (id, username))
 
     def add_restaurant_employee(self, id: int, username: str) -> None:
         """
         Adds an employee to a restaurant, raising an exception if either doesn't
         exist.
         """
-        with self.conn:
-            if self.conn.execute("SELECT Username FROM Accounts WHERE Username = ?", (username,)).fetchone() is None:
+        with self._transaction():
+            if not self.conn.execute(_SQL_ACCOUNT_EXISTS, (username,)).fetchone()[0]:
                 raise Exception("user does not exist")
 
             # the constraints will raise an exception if it changes between the check and here
-            self.conn.execute("INSERT INTO RestaurantEmployees (RestaurantID, Username) VALUES (?, ?) ON CONFLICT (RestaurantID, Username) DO NOTHING", (id, username))
-            self.conn.commit()
+            self.conn.execute(_SQL_ADD_RESTAURANT_EMPLOYEE, (id, username))
 
     def add_menu_item(self, restaurant_id: int, item_name: str, item_price: int) -> int:
         """
         Adds a menu item to a restaurant with specified item name and price.
         """
-        with self.conn:
-            if self.conn.execute("SELECT RestaurantID FROM Restaurants WHERE RestaurantID = ? AND Deleted <> TRUE", (restaurant_id,)).fetchone() is None:
+        # only inserts the item if the restaurant exists and hasn't been deleted
+        row = self.conn.execute(_SQL_ADD_MENU_ITEM, (item_name, item_price, restaurant_id)).fetchone()
+        if row is None:
+            raise OrderTransitionError(f"restaurant does not exist or has been deleted")
+        return row[0]
+
+    def add_menu_items(self, restaurant_id: int, items: List[Tuple[str, int]]) -> List[int]:
+        """
+        Adds multiple (item name, price) menu items to a restaurant at once,
+        returning the new item IDs in the same order.
+        """
+        with self._transaction():
+            if not self.conn.execute(_SQL_RESTAURANT_EXISTS, (restaurant_id,)).fetchone()[0]:
                 raise OrderTransitionError(f"restaurant does not exist or has been deleted")
-            item_id = self.conn.execute("INSERT INTO MenuItems (RestaurantID, Name, Price) VALUES (?, ?, ?) RETURNING ItemID", (restaurant_id, item_name, item_price)).fetchone()[0]
-            self.conn.commit()
-            return item_id
+            self.conn.executemany(_SQL_ADD_MENU_ITEMS, [(restaurant_id, item_name, item_price) for item_name, item_price in items])
+
+            # we hold the write lock until the end of the transaction and the ids are autoincrement, so the new items are the last ones for the restaurant
+            item_ids = [item_id for (item_id,) in self.conn.execute(_SQL_GET_NEW_MENU_ITEM_IDS, (restaurant_id, len(items)))]
+            item_ids.reverse()
+            return item_ids
 
     def update_menu_item(self, restaurant_id: int, item_id: int, item_name: str, item_price: int) -> None:
         """
         Adds a menu item to a restaurant with the specified name and price.
         """
-        with self.conn:
-            if self.conn.execute("SELECT RestaurantID FROM Restaurants WHERE RestaurantID = ? AND Deleted <> TRUE", (restaurant_id,)).fetchone() is None:
+        with self._transaction():
+            if not self.conn.execute(_SQL_RESTAURANT_EXISTS, (restaurant_id,)).fetchone()[0]:
                 raise OrderTransitionError(f"restaurant does not exist or has been deleted")
             # restaurantid check seems unnecessary, but is required for security
-            self.conn.execute("UPDATE MenuItems SET Name = ?, Price = ? WHERE RestaurantID = ? AND ItemID = ?", (item_name, item_price, restaurant_id, item_id))
-            self.conn.commit()
+            self.conn.execute(_SQL_UPDATE_MENU_ITEM, (item_name, item_price, restaurant_id, item_id))
 
     def delete_menu_item(self, restaurant_id: int, item_id: int) -> None:
         """
         Deletes a menu item from a restaurant if it exists.
         """
-        with self.conn:
-            # restaurantid check seems unnecessary, but is required for security
-            self.conn.execute("UPDATE MenuItems SET Deleted = TRUE WHERE RestaurantID = ? AND ItemID = ?", (restaurant_id, item_id))
-            self.conn.commit()
+        # restaurantid check seems unnecessary, but is required for security
+        self.conn.execute(_SQL_DELETE_MENU_ITEM, (restaurant_id, item_id))
 
     def update_account(self, username, first_name, last_name, address, card_number, card_expiry, card_code, password=None):
         """
@@ -463,14 +674,77 @@ class RestaurantDB:
         the password.
         """
         if password is not None:
-            sha = hashlib.sha256()
-            sha.update(password.encode("utf-8"))
-            password = sha.hexdigest()
-        with self.conn:
-            if password is not None:
-                self.conn.execute("UPDATE Accounts SET PasswordSHA256 = ? WHERE Username = ?", (password, username))
-            self.conn.execute("UPDATE Accounts SET FirstName = ?, LastName = ?, Address = ?, CardNumber = ?, CardExpiry = ?, CardCode = ? WHERE Username = ?", (first_name, last_name, address, card_number, card_expiry, card_code, username))
-            self.conn.commit()
+            password = hashlib.sha256(password.encode("utf-8")).hexdigest()
+        # a null password hash keeps the current one
+        self.conn.execute(_SQL_UPDATE_ACCOUNT, (first_name, last_name, address, card_number, card_expiry, card_code, password, username))
+
+class ItemDeltaBatcher:
+    """
+    Groups order item changes which arrive within a short window of each other
+    (e.g., a burst of add/subtract clicks) into a single transaction, instead of
+    committing each one separately.
+
+    The changes for each order are still applied one after another in the order
+    they were submitted (see RestaurantDB.modify_order_items), so the resulting
+    quantities are the same as if they weren't batched.
+    """
+
+    """How long to wait (in seconds) for more changes after the first one"""
+    WINDOW = 0.005
+
+    def __init__(self, db: RestaurantDB, window: float = WINDOW):
+        self.db = db
+        self.window = window
+        self._pending = {}  # order id -> [(item id, delta, future)]
+
+    async def submit(self, order_id: int, item_id: int, delta: int) -> None:
+        """
+        Changes the quantity of an item in an order, returning once the change
+        has been committed (or raising the exception if it failed).
+        """
+        await self.submit_many(order_id, [(item_id, delta)])
+
+    async def submit_many(self, order_id: int, deltas: List[Tuple[int, int]]) -> None:
+        """
+        Changes the quantities of multiple (item_id, delta) items in an order,
+        like submit. The changes are applied together with the other changes to
+        the order, so either all or none of them are committed.
+        """
+        if not deltas:
+            return
+        loop = asyncio.get_running_loop()
+        if not self._pending:
+            loop.call_later(self.window, self._flush)
+        future = loop.create_future()
+        self._pending.setdefault(order_id, []).extend((item_id, delta, future) for item_id, delta in deltas)
+        await future
+
+    def _flush(self) -> None:
+        pending, self._pending = self._pending, {}
+        done = []
+        try:
+            with self.db.batch():
+                for order_id, changes in pending.items():
+                    try:
+                        # in a savepoint, so if one order can't be modified, it won't affect the other ones
+                        self.db.modify_order_items(order_id, [(item_id, delta) for item_id, delta, _ in changes])
+                    except Exception as ex:
+                        for _, _, future in changes:
+                            if not future.done():  # the submit may have been cancelled
+                                future.set_exception(ex)
+                    else:
+                        done.extend(future for _, _, future in changes)
+        except Exception as ex:
+            # the batch failed as a whole (e.g., it couldn't be started or
+            # committed), so fail every change which wasn't already failed above
+            for changes in pending.values():
+                for _, _, future in changes:
+                    if not future.done():
+                        future.set_exception(ex)
+        else:
+            for future in done:
+                if not future.done():  # the submit may have been cancelled
+                    future.set_result(None)
 
 class BaseHandler(tornado.web.RequestHandler):
     """
@@ -480,12 +754,21 @@ class BaseHandler(tornado.web.RequestHandler):
     FLASH_COOKIE_NAME = "flash"
     USERNAME_COOKIE_NAME = "username"
 
-    @property
-    def db(self) -> RestaurantDB:
-        db = self.settings["db"]
-        if not isinstance(db, RestaurantDB):
-            raise ValueError("No database set in the application settings")
-        return db
+    """How many flash cookie ids, and pending messages for each one, to keep"""
+    FLASH_STORE_SIZE = 10000
+    FLASH_MESSAGES_SIZE = 10
+
+    # pending flash messages by the random id in the flash cookie, oldest first
+    # (in memory, since we only run a single server process)
+    _flash_store: "collections.OrderedDict[str, List[Tuple[str, str]]]" = collections.OrderedDict()
+
+    def initialize(self, db: RestaurantDB, item_batcher: ItemDeltaBatcher):
+        """
+        Sets up the handler with the application's database (passed to every
+        route by restaurant()). Called by Tornado.
+        """
+        self.db = db
+        self.item_batcher = item_batcher
 
 
     def prepare(self):
@@ -495,6 +778,7 @@ class BaseHandler(tornado.web.RequestHandler):
 
         # get user info
         self.__user_info = None
+        self.__roles = {}
         username = self.get_signed_cookie(BaseHandler.USERNAME_COOKIE_NAME)
         if username is not None:
             self.__user_info = self.db.get_user_info(username.decode("utf-8"))
@@ -513,6 +797,34 @@ class BaseHandler(tornado.web.RequestHandler):
         return self.__user_info[0]
 
 
+    def perm(self, restaurant_id: int) -> Tuple[bool, bool]:
+        """
+        Returns whether the current user is the (owner, employee) of the
+        specified restaurant. Cached for the rest of the request.
+        """
+        username = self.current_user
+        if username is None:
+            return False, False
+        roles = self.__roles.get((restaurant_id, username))
+        if roles is None:
+            roles = self.__roles[(restaurant_id, username)] = self.db.get_user_roles(restaurant_id, username)
+        return roles
+
+
+    async def perm_async(self, restaurant_id: int) -> Tuple[bool, bool]:
+        """
+        Like perm, but runs the query on a reader thread (see RestaurantDB.read)
+        if the roles aren't already cached.
+        """
+        username = self.current_user
+        if username is None:
+            return False, False
+        roles = self.__roles.get((restaurant_id, username))
+        if roles is None:
+            roles = self.__roles[(restaurant_id, username)] = await self.db.read(self.db.get_user_roles, restaurant_id, username)
+        return roles
+
+
     def set_current_user(self, username: Optional[str]=None):
         """
         Sets the currently logged in user. Does not validate it.
@@ -528,36 +840,34 @@ class BaseHandler(tornado.web.RequestHandler):
         Shows a message on the next page load which calls our render function.
         The kind is used in the class name so it can be styled CSS.
 
-        Note that this is limited by the maximum cookie length.
+        The messages are kept on the server, and the cookie only holds a random
+        id for them, so it doesn't need to be signed. If there are too many
+        pending messages (or cookie ids), the oldest ones are dropped.
         """
-        flash_messages = self.get_flash()
-        flash_messages.append([kind, msg])  # use an array instead of an object to keep it compact
-        self.set_secure_cookie(BaseHandler.FLASH_COOKIE_NAME, json.dumps(flash_messages))
+        key = self.get_cookie(BaseHandler.FLASH_COOKIE_NAME)
+        if key is None:
+            key = secrets.token_urlsafe(16)
+            self.set_cookie(BaseHandler.FLASH_COOKIE_NAME, key, httponly=True)
+            self.request.cookies[BaseHandler.FLASH_COOKIE_NAME] = key  # so we use the same one for the rest of the request
+        store = BaseHandler._flash_store
+        messages = store.setdefault(key, [])
+        messages.append((kind, msg))
+        del messages[:-BaseHandler.FLASH_MESSAGES_SIZE]
+        store.move_to_end(key)
+        while len(store) > BaseHandler.FLASH_STORE_SIZE:
+            store.popitem(last=False)
 
 
     def get_flash(self, clear: bool=True) -> List[Tuple[str, str]]:
         """
-        Gets pending flash messages and clears the cookie.
+        Gets pending flash messages and clears them.
         """
-        flash_messages = []
-        try:
-            obj = json.loads(self.get_signed_cookie(BaseHandler.FLASH_COOKIE_NAME))
-            if isinstance(obj, list):
-                for x in obj:
-                    if not isinstance(x, list):
-                        continue
-                    if len(x) != 2:
-                        continue
-                    if not isinstance(x[0], str):
-                        continue
-                    if not isinstance(x[1], str):
-                        continue
-                    flash_messages.append((x[0], x[1]))
-        except:
-            pass
+        key = self.get_cookie(BaseHandler.FLASH_COOKIE_NAME)
+        if key is None:
+            return []  # nothing was ever flashed to this browser (the common case)
         if clear:
-            self.clear_cookie(BaseHandler.FLASH_COOKIE_NAME)
-        return flash_messages
+            return BaseHandler._flash_store.pop(key, [])
+        return list(BaseHandler._flash_store.get(key, []))
 
 
     def render(self, *args, **kwargs):
@@ -593,7 +903,7 @@ class AccountHandler(BaseHandler):
         logged in user.
         """
 
-        username = self.get_current_user()
+        username = self.current_user
         if not username:
             self.redirect("/account/login", status=302)
             return
@@ -611,7 +921,7 @@ class AccountHandler(BaseHandler):
         Handles POST requests to the account page, updating the information.
         """
 
-        username = self.get_current_user()
+        username = self.current_user
         if username is None:
             self.flash("Not logged in.", kind="error")
             self.redirect("/account/login", False, status=303)
@@ -731,11 +1041,9 @@ class AccountLoginHandler(BaseHandler):
             self.redirect(self.request.path, status=303)
             return
 
-        hashed_password = hashlib.sha256()
-        hashed_password.update(password.encode("utf-8"))
-        hashed_password = hashed_password.hexdigest()
+        hashed_password = hashlib.sha256(password.encode("utf-8")).hexdigest()
 
-        if hashed_password != correct_password_hash:
+        if not hmac.compare_digest(hashed_password, correct_password_hash):  # constant-time, so it doesn't leak how much of the hash matched
             self.flash("Incorrect password.", kind="error")
             self.redirect(self.request.path, status=303)
             return
@@ -780,7 +1088,7 @@ class RestaurantsHandler(BaseHandler):
         """
         Handles POST requests to the restaurants page, creating a new restaurant.
         """
-        username = self.get_current_user()
+        username = self.current_user
         if username is None:
             self.flash("Not logged in.", kind="error")
             self.redirect(self.request.path, status=303)
@@ -810,25 +1118,25 @@ class RestaurantHandler(BaseHandler):
         restaurant, allowing customers to place orders, employees to complete
         orders, and owners to edit restaurant information.
         """
-        restaurant = self.db.get_restaurant(int(id))
-        if restaurant is None:
+        id = int(id)
+        page = self.db.get_restaurant_page(id, self.current_user)
+        if page is None:
             self.flash(f"Restaurant {id} does not exist.", kind="error")
             self.redirect("/restaurants")
             return
 
-        menu_items = self.db.get_menu_items(int(id))
-
-        username = self.get_current_user()
-        is_user_employee = self.db.is_user_employee(int(id), username) if username else False
-        is_user_owner = self.db.is_user_owner(int(id), username) if username else False
+        restaurant = page["Restaurant"]
+        menu_items = page["MenuItems"]
+        is_user_owner = page["IsUserOwner"]
+        is_user_employee = page["IsUserEmployee"]
 
         orders = None
         if is_user_employee:
-            orders = self.db.get_restaurant_active_orders(int(id))
+            orders = self.db.get_restaurant_active_orders(id)
 
         employees = None
         if is_user_owner:
-            employees = self.db.get_restaurant_employees(int(id))
+            employees = self.db.get_restaurant_employees(id)
 
         self.render("restaurant.html",
             restaurant=restaurant,
@@ -845,14 +1153,15 @@ class RestaurantHandler(BaseHandler):
         Handles POST requests to the restaurant page.
         """
 
-        username = self.get_current_user()
+        username = self.current_user
         if not username:
             self.flash("Not logged in.", kind="error")
             self.redirect("/account/login", 303)
             return
 
         id = int(id)
-        action = dict(enumerate(self.get_body_argument("action", default="", strip=False).split(":")))
+        action = self.get_body_argument("action", default="", strip=False).split(":")
+        action += [""] * (3 - len(action))  # so missing parts are just empty
         if action[0] == "restaurant":
             if action[1] == "update":
                 return self.post_restaurant_update(id)
@@ -900,7 +1209,8 @@ class RestaurantHandler(BaseHandler):
     def post_restaurant_update(self, restaurant_id):
         """ POST action = restaurant:update """
 
-        if not self.db.is_user_owner(restaurant_id, self.get_current_user()):
+        is_owner, _ = self.perm(restaurant_id)
+        if not is_owner:
             self.flash("Not authorized to perform this action.", kind="error")
             self.redirect(self.request.path, 303)
             return
@@ -917,7 +1227,8 @@ class RestaurantHandler(BaseHandler):
     def post_restaurant_delete(self, restaurant_id):
         """ POST action = restaurant:delete """
 
-        if not self.db.is_user_owner(restaurant_id, self.get_current_user()):
+        is_owner, _ = self.perm(restaurant_id)
+        if not is_owner:
             self.flash("Not authorized to perform this action.", kind="error")
             self.redirect(self.request.path, 303)
             return
@@ -927,13 +1238,14 @@ class RestaurantHandler(BaseHandler):
 
     def post_restaurant_order(self, restaurant_id):
         """ POST action = restaurant:order """
-        order_id = self.db.create_order(restaurant_id, self.get_current_user())
+        order_id = self.db.create_order(restaurant_id, self.current_user)
         self.redirect(f"/orders/{order_id}", 303)
 
     def post_employee_add(self, restaurant_id):
         """ POST action = employee:new:add """
 
-        if not self.db.is_user_owner(restaurant_id, self.get_current_user()):
+        is_owner, _ = self.perm(restaurant_id)
+        if not is_owner:
             self.flash("Not authorized to perform this action.", kind="error")
             self.redirect(self.request.path, 303)
             return
@@ -947,7 +1259,8 @@ class RestaurantHandler(BaseHandler):
     def post_employee_remove(self, restaurant_id, username):
         """ POST action = employee:{username}:remove """
 
-        if not self.db.is_user_owner(restaurant_id, self.get_current_user()):
+        is_owner, _ = self.perm(restaurant_id)
+        if not is_owner:
             self.flash("Not authorized to perform this action.", kind="error")
             self.redirect(self.request.path, 303)
             return
@@ -958,7 +1271,8 @@ class RestaurantHandler(BaseHandler):
     def post_item_add(self, restaurant_id):
         """ POST action = item:new:add """
 
-        if not self.db.is_user_owner(restaurant_id, self.get_current_user()):
+        is_owner, _ = self.perm(restaurant_id)
+        if not is_owner:
             self.flash("Not authorized to perform this action.", kind="error")
             self.redirect(self.request.path, 303)
             return
@@ -979,7 +1293,8 @@ class RestaurantHandler(BaseHandler):
     def post_item_update(self, restaurant_id, item_id):
         """ POST action = item:{item_id}:update """
 
-        if not self.db.is_user_owner(restaurant_id, self.get_current_user()):
+        is_owner, _ = self.perm(restaurant_id)
+        if not is_owner:
             self.flash("Not authorized to perform this action.", kind="error")
             self.redirect(self.request.path, 303)
             return
@@ -1000,7 +1315,8 @@ class RestaurantHandler(BaseHandler):
     def post_item_delete(self, restaurant_id, item_id):
         """ POST action = item:{item_id}:delete """
 
-        if not self.db.is_user_owner(restaurant_id, self.get_current_user()):
+        is_owner, _ = self.perm(restaurant_id)
+        if not is_owner:
             self.flash("Not authorized to perform this action.", kind="error")
             self.redirect(self.request.path, 303)
             return
@@ -1011,7 +1327,7 @@ class RestaurantHandler(BaseHandler):
     def post_order_accept(self, restaurant_id, order_id):
         """ POST action = order:{order_id}:accept """
         try:
-            self.db.transition_order(self.get_current_user(), restaurant_id, order_id, RestaurantDB.ORDER_ACCEPTED)
+            self.db.transition_order(self.current_user, restaurant_id, order_id, RestaurantDB.ORDER_ACCEPTED)
             self.flash("Order accepted.", kind="info")
         except OrderTransitionError as ex:
             self.flash(str(ex), kind="error")
@@ -1020,7 +1336,7 @@ class RestaurantHandler(BaseHandler):
     def post_order_deliver(self, restaurant_id, order_id):
         """ POST action = order:{order_id}:deliver """
         try:
-            self.db.transition_order(self.get_current_user(), restaurant_id, order_id, RestaurantDB.ORDER_DELIVERED)
+            self.db.transition_order(self.current_user, restaurant_id, order_id, RestaurantDB.ORDER_DELIVERED)
             self.flash("Order delivered.", kind="info")
         except OrderTransitionError as ex:
             self.flash(str(ex), kind="error")
@@ -1032,17 +1348,17 @@ class CustomerOrdersHandler(BaseHandler):
     Handles requests to the customer own orders list.
     """
 
-    def get(self):
+    async def get(self):
         """
         Handles GET requests to the customer orders page, showing details about
         the logged in customer's order status.
         """
-        username = self.get_current_user()
+        username = self.current_user
         if not username:
             self.redirect("/account/login", status=302)
             return
 
-        orders = self.db.get_user_orders(username)
+        orders = await self.db.read(self.db.get_user_orders, username)
         self.render("orders.html", orders=orders)  # TODO: get data
 
 
@@ -1052,23 +1368,40 @@ class CustomerOrderHandler(BaseHandler):
     perspective.
     """
 
-    def get(self, id: str):
+    # matches the valid actions: order:{action} or item:{item_id}:{action}
+    _ACTION_RE = re.compile(r"order:(pay|cancel|accept|deliver)|item:([0-9]+):(add|subtract)")
+
+    # order:{action} -> handler method
+    _DISPATCH = {
+        "pay": "post_order_pay",
+        "cancel": "post_order_cancel",
+        "accept": "post_order_accept",
+        "deliver": "post_order_deliver",
+    }
+
+    # item:{item_id}:{action} -> handler method
+    _ITEM_DISPATCH = {
+        "add": "post_item_add",
+        "subtract": "post_item_subtract",
+    }
+
+    async def get(self, id: str):
         """
         Handles GET requests to the customer order page, showing details about a
         single order, and allowing pending orders to be modified.
         """
-        username = self.get_current_user()
+        username = self.current_user
         if not username:
             self.redirect("/account/login", status=302)
             return
 
-        order = self.db.get_order(int(id))
+        order = await self.db.read(self.db.get_order, int(id))
         if not order:
             self.flash("Order does not exist.", kind="error")
             self.redirect("/orders")
             return
 
-        is_employee = self.db.is_user_employee(order["RestaurantID"], username)
+        _, is_employee = await self.perm_async(order["RestaurantID"])
         is_own_order = order["Username"] == username
 
         if not (is_employee or is_own_order):
@@ -1083,40 +1416,32 @@ class CustomerOrderHandler(BaseHandler):
         )
 
 
-    def post(self, id: str):
+    async def post(self, id: str):
         """
         Handles POST requests to the customer order page.
         """
 
-        username = self.get_current_user()
+        username = self.current_user
         if not username:
             self.flash("Not logged in.", kind="error")
             self.redirect("/account/login", 303)
             return
 
         id = int(id)
-        action = dict(enumerate(self.get_body_argument("action", default="", strip=False).split(":")))
-        if action[0] == "order":
-            if action[1] == "pay":
-                return self.post_order_pay(id)
-            if action[1] == "cancel":
-                return self.post_order_cancel(id)
-            if action[1] == "accept":
-                return self.post_order_accept(id)
-            if action[1] == "deliver":
-                return self.post_order_deliver(id)
-        if action[0] == "item":
-            item_id = None
-            try:
-                item_id = int(action[1])
-            except Exception as ex:
-                self.flash("Bad action item.", kind="error")
-                self.redirect(self.request.path, status=303)
-                return
-            if action[2] == "add":
-                return self.post_item_add(id, item_id)
-            if action[2] == "subtract":
-                return self.post_item_subtract(id, item_id)
+        action = self.get_body_argument("action", default="", strip=False)
+        m = CustomerOrderHandler._ACTION_RE.fullmatch(action)
+        if m:
+            order_action, item_id, item_action = m.groups()
+            if order_action:
+                return getattr(self, CustomerOrderHandler._DISPATCH[order_action])(id)
+            return await getattr(self, CustomerOrderHandler._ITEM_DISPATCH[item_action])(id, int(item_id))
+
+        # not a valid action, so just figure out which error to show
+        action = action.split(":")
+        if action[0] == "item" and not (len(action) > 1 and action[1].isascii() and action[1].isdigit()):
+            self.flash("Bad action item.", kind="error")
+            self.redirect(self.request.path, status=303)
+            return
 
         self.flash("Bad action.", kind="error")
         self.redirect(self.request.path, status=303)
@@ -1124,7 +1449,7 @@ class CustomerOrderHandler(BaseHandler):
     def post_order_pay(self, order_id: int):
         """ POST action = order:pay """
         try:
-            self.db.transition_order(self.get_current_user(), None, order_id, RestaurantDB.ORDER_PAID)
+            self.db.transition_order(self.current_user, None, order_id, RestaurantDB.ORDER_PAID)
             self.flash("Order submitted.", kind="info")
         except OrderTransitionError as ex:
             self.flash(str(ex), kind="error")
@@ -1133,7 +1458,7 @@ class CustomerOrderHandler(BaseHandler):
     def post_order_cancel(self, order_id: int):
         """ POST action = order:cancel """
         try:
-            self.db.transition_order(self.get_current_user(), None, order_id, RestaurantDB.ORDER_CANCELLED)
+            self.db.transition_order(self.current_user, None, order_id, RestaurantDB.ORDER_CANCELLED)
             self.flash("Order cancelled.", kind="info")
         except OrderTransitionError as ex:
             self.flash(str(ex), kind="error")
@@ -1142,7 +1467,7 @@ class CustomerOrderHandler(BaseHandler):
     def post_order_accept(self, order_id: int):
         """ POST action = order:accept """
         try:
-            self.db.transition_order(self.get_current_user(), None, order_id, RestaurantDB.ORDER_ACCEPTED)
+            self.db.transition_order(self.current_user, None, order_id, RestaurantDB.ORDER_ACCEPTED)
             self.flash("Order accepted.", kind="info")
         except OrderTransitionError as ex:
             self.flash(str(ex), kind="error")
@@ -1151,43 +1476,96 @@ class CustomerOrderHandler(BaseHandler):
     def post_order_deliver(self, order_id: int):
         """ POST action = order:deliver """
         try:
-            self.db.transition_order(self.get_current_user(), None, order_id, RestaurantDB.ORDER_DELIVERED)
+            self.db.transition_order(self.current_user, None, order_id, RestaurantDB.ORDER_DELIVERED)
             self.flash("Order delivered.", kind="info")
         except OrderTransitionError as ex:
             self.flash(str(ex), kind="error")
         self.redirect(self.request.path, 303)
 
-    def post_item_add(self, order_id: int, item_id: int):
+    async def post_item_add(self, order_id: int, item_id: int):
         """ POST action = item:{item_id}:add """
-        if self.db.get_order_customer(order_id) != self.get_current_user():
+        if await self.db.read(self.db.get_order_customer, order_id) != self.current_user:
             self.flash("Not the order owner.", kind="error")
         else:
-            self.db.modify_order_item(order_id, item_id, 1)
+            await self.item_batcher.submit(order_id, item_id, 1)
         self.redirect(self.request.path, 303)
 
-    def post_item_subtract(self, order_id: int, item_id: int):
+    async def post_item_subtract(self, order_id: int, item_id: int):
         """ POST action = item:{item_id}:subtract """
-        if self.db.get_order_customer(order_id) != self.get_current_user():
+        if await self.db.read(self.db.get_order_customer, order_id) != self.current_user:
             self.flash("Not the order owner.", kind="error")
         else:
-            self.db.modify_order_item(order_id, item_id, -1)
+            await self.item_batcher.submit(order_id, item_id, -1)
         self.redirect(self.request.path, 303)
 
+
+class CustomerOrderItemsHandler(BaseHandler):
+    """
+    Handles requests to change the quantities of multiple items in a customer's
+    order at once (in a single transaction), using JSON instead of forms.
+    """
+
+    async def post(self, id: str):
+        """
+        Handles POST requests to the order items endpoint, which take a JSON
+        list of [item_id, delta] pairs, and respond with the updated order
+        items (or an error message).
+        """
+        username = self.current_user
+        if not username:
+            return self.write_error_json(401, "Not logged in.")
+
+        try:
+            body = tornado.escape.json_decode(self.request.body)
+            if not (isinstance(body, list) and all(isinstance(pair, list) for pair in body)):
+                raise TypeError("item deltas must be a list of pairs")
+            deltas = [(int(item_id), int(delta)) for item_id, delta in body]
+        except (ValueError, TypeError):
+            return self.write_error_json(400, "Bad item deltas.")
+
+        order_id = int(id)
+        customer = await self.db.read(self.db.get_order_customer, order_id)
+        if customer is None:
+            return self.write_error_json(404, "Order does not exist.")
+        if customer != username:
+            return self.write_error_json(403, "Not the order owner.")
+
+        try:
+            await self.item_batcher.submit_many(order_id, deltas)
+        except OrderTransitionError as ex:
+            return self.write_error_json(409, str(ex))
+        except (sqlite3.IntegrityError, OverflowError):
+            # the foreign key constraint fails for unknown items
+            return self.write_error_json(400, "Unknown menu item.")
+
+        order = await self.db.read(self.db.get_order, order_id)
+        self.write({"Items": order["Items"]})
+
+    def write_error_json(self, status: int, msg: str):
+        """
+        Responds with an error message.
+        """
+        self.set_status(status)
+        self.write({"Error": msg})
+
 def restaurant(db: RestaurantDB):
     """
     Initialize and return the restaurant application.
     """
+    # the database is passed straight to each handler instead of being looked up in the settings for every request
+    handler_args = dict(db=db, item_batcher=ItemDeltaBatcher(db))
     return tornado.web.Application(
         [
-            (r"/", IndexHandler),
-            (r"/account", AccountHandler),
-            (r"/account/create", AccountCreateHandler),
-            (r"/account/login", AccountLoginHandler),
-            (r"/account/logout", AccountLogoutHandler),
-            (r"/restaurants", RestaurantsHandler),
-            (r"/restaurants/([0-9]+)", RestaurantHandler),
-            (r"/orders", CustomerOrdersHandler),
-            (r"/orders/([0-9]+)", CustomerOrderHandler),
+            (r"/", IndexHandler, handler_args),
+            (r"/account", AccountHandler, handler_args),
+            (r"/account/create", AccountCreateHandler, handler_args),
+            (r"/account/login", AccountLoginHandler, handler_args),
+            (r"/account/logout", AccountLogoutHandler, handler_args),
+            (r"/restaurants", RestaurantsHandler, handler_args),
+            (r"/restaurants/([0-9]+)", RestaurantHandler, handler_args),
+            (r"/orders", CustomerOrdersHandler, handler_args),
+            (r"/orders/([0-9]+)", CustomerOrderHandler, handler_args),
+            (r"/orders/([0-9]+)/items", CustomerOrderItemsHandler, handler_args),
         ],
 
         # development
@@ -1200,35 +1578,42 @@ def restaurant(db: RestaurantDB):
 
         # files
         template_path="./frontend/templates",
-
-        # database
-        db=db,
     )
 
 
+def _seed_value(key: str, value):
+    """
+    Converts a value from the sample data into what's stored in the database
+    (prices are in dollars in the sample data, but cents in the database).
+    """
+    if key in ['Total', 'Price']:
+        return int(value * 100)
+    return value
+
+
 def restaurant_db(filename: str):
     """
     Initializes the restaurant database.
     """
-    conn = sqlite3.connect(filename)
+    conn = sqlite3.connect(filename, timeout=5.0)
+    _tune_connection(conn)
     with open("database.sql", "r") as f:
         conn.executescript(f.read())
-    with open('A1/INITIAL_DATA.yml', 'r') as f:
-        data = yaml.load(f, Loader=yaml.Loader)
+    data = load_yaml('A1/INITIAL_DATA.yml')
+    # group the rows by table and columns, so each group is a single prepared statement run with executemany
+    stmts = {}
+    rows = {}
     for table in data:
         for row in data[table]:
-            keys = sorted(row.keys())
-            values = [f"'{str(row[key])}'" for key in keys]
-            for (i, key) in enumerate(keys):
-                if key in ['Total', 'Price']:
-                    values[i] = str(int(row[key] * 100))
-                elif isinstance(row[key], bool):
-                    values[i] = 'TRUE' if row[key] else 'FALSE'
-                elif isinstance(row[key], int):
-                    values[i] = str(row[key])
-            value_keys = [f'"{key}"' for key in keys]
-            conn.execute(f"INSERT INTO {table} ({', '.join(value_keys)}) VALUES ({', '.join(values)});")
-    conn.commit()
+            sig = (table, tuple(sorted(row.keys())))
+            if sig not in stmts:
+                value_keys = [f'"{key}"' for key in sig[1]]
+                stmts[sig] = f"INSERT INTO \"{table}\" ({', '.join(value_keys)}) VALUES ({', '.join('?' * len(value_keys))})"
+            rows.setdefault(sig, []).append(tuple(_seed_value(key, row[key]) for key in sig[1]))
+    with conn:  # all in one transaction
+        for sig, values in rows.items():
+            conn.executemany(stmts[sig], values)
+    conn.execute("ANALYZE")  # gather statistics for the query planner
     conn.close()
 
 
@@ -1243,7 +1628,7 @@ async def main(port=8081, db='restaurant.db'):
         print("using existing database (delete it to re-initialize it with sample data)")
 
     print(f"starting server on port {port} (http://127.0.0.1:{port})")
-    app = restaurant(RestaurantDB(db))
+    app = restaurant(RestaurantDB(db, readers=4))
     app.listen(port)
     await asyncio.Event().wait()
 
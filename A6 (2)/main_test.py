@@ -8,15 +8,17 @@ database each time.
 """
 
 import asyncio
+import concurrent.futures
 import os
 import selenium.webdriver
 import multiprocessing
+import sqlite3
 import tempfile
 import yaml
 
 from selenium.webdriver.common.by import By
 
-from typing import Optional
+from typing import List, Optional, Tuple
 
 import main
 
@@ -37,8 +39,9 @@ class Chrome(selenium.webdriver.Chrome):
 
 class App:
     """
-    Runs a restaurant server with a fresh database in a separate process (to
-    avoid GIL and dangling socket issues).
+    Runs a restaurant server in a separate process (to avoid GIL and dangling
+    socket issues). The server is kept running for all of the tests, so call
+    reset_db before each one to get a freshly-initialized database again.
 
     Use it with the "with" statement.
     """
@@ -52,8 +55,10 @@ class App:
 
         # initialize the process
         self.port = port
+        self.url = f"http://127.0.0.1:{port}"
         self.process = multiprocessing.Process(target=self.__main__)
         self.ready = multiprocessing.Event()
+        self.conn = None
 
     def __main__(self):
         async def real_main(port):
@@ -66,10 +71,38 @@ class App:
     def __enter__(self):
         self.process.start()
         self.ready.wait()
-        return f"http://127.0.0.1:{self.port}"
+
+        # keep a copy of the sample data in memory to reset the database with
+        # (opened after starting the server, since sqlite connections must not
+        # be inherited across a fork, and before any requests could change it)
+        try:
+            self.conn = sqlite3.connect(self.filename, isolation_level=None)
+            self.conn.execute("ATTACH DATABASE ':memory:' AS seed")
+            self.tables = [name for (name,) in self.conn.execute("SELECT name FROM main.sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+            for table in self.tables:
+                self.conn.execute(f'CREATE TABLE seed."{table}" AS SELECT * FROM main."{table}"')
+        except:
+            self.__exit__(None, None, None)
+            raise
+        return self
+
+    def reset_db(self):
+        """
+        Restores the sample data in the server's database in place (foreign
+        keys aren't enforced on this connection, so the order doesn't matter).
+        """
+        self.conn.execute("BEGIN IMMEDIATE")
+        # the sample data has explicit ids, so re-inserting it puts the autoincrement counters back too
+        self.conn.execute("DELETE FROM main.sqlite_sequence")
+        for table in self.tables:
+            self.conn.execute(f'DELETE FROM main."{table}"')
+            self.conn.execute(f'INSERT INTO main."{table}" SELECT * FROM seed."{table}"')
+        self.conn.execute("COMMIT")
 
     def __exit__(self, type, value, traceback):
         self.process.kill()
+        if self.conn is not None:
+            self.conn.close()
         for suffix in ["", "-shm", "-wal"]:
             try:
                 os.remove(self.filename + suffix)
@@ -77,176 +110,266 @@ class App:
                 pass
 
 
+# scripts used to inspect and modify the page in the browser
+
+_JS_HIGHLIGHT = "arguments[0].setAttribute('style', 'outline: red dashed 3px !important')"
+
+# adds a button for an action which isn't on the page
+_JS_FORCE_ACTION = """
+    return (action => {
+        let btn = document.querySelector('form').appendChild(document.createElement('button'))
+        btn.textContent = 'FORCED ACTION: ' + action
+        btn.setAttribute('name', action)
+        btn.setAttribute('value', action)
+        btn.setAttribute('style', 'outline: red dashed 3px !important')
+        return btn
+    })(arguments[0])
+"""
+
+_JS_PATHNAME = "return window.location.pathname"
+_JS_FLASH = "return Array.from(document.querySelectorAll('aside.flash')).map(el => el.textContent.trim()).join('\\n')"
+_JS_USERNAME = "return document.querySelector('[data-username]')?.dataset?.username ?? null"
+_JS_ORDER_IDS = "return Array.from(document.querySelectorAll('[data-orderid]')).map(el => el.dataset.orderid)"
+_JS_RESTAURANT_IDS = "return Array.from(document.querySelectorAll('[data-restaurantid]')).map(el => el.dataset.restaurantid)"
+_JS_RESTAURANT_NAME = "return document.querySelector('header > h1').textContent.trim()"
+_JS_MENU_ITEMS = """
+    return Array.from(document.querySelectorAll("section.menu > .item > .name"))
+        .map(el => el.tagName == "INPUT" ? el.value : el.textContent)
+        .map(v => v.trim())
+        .filter(v => v.length)
+"""
+_JS_ACTIONS = "return Array.from(document.querySelectorAll('[name=action]')).map(el => el.value)"
+_JS_ORDER_ITEMS = """
+    return Array.from(document.querySelectorAll("section.menu > .item"))
+        .map(el => `${el.querySelector('.name').textContent.trim()}=${el.querySelector('.quantity').textContent.trim()}`)
+"""
+_JS_ORDER_STATUS = "return document.querySelector('header.page--order').dataset.orderstatus"
+_JS_RESTAURANT_NAMES = "return Array.from(document.querySelectorAll('section.restaurants > a')).map(el => el.textContent.trim())"
+_JS_EMPLOYEE_USERNAMES = "return Array.from(document.querySelectorAll('section.employees > .employee > .username')).map(el => el.textContent.trim())"
+
+
+def case_heading(uci: int, uc: dict, tci: int, tc: dict) -> str:
+    """
+    Returns the start of the report for a test case.
+    """
+    return f"\n\n\\newpage\n\n#### {uci+1}.{tci+1}. {uc['Name']} ({tc['Name']})\n\n"
+
+
+def run_test_case(chrome: Chrome, app: App, uci: int, uc: dict, tci: int, tc: dict, logged_in: Optional[str]) -> Tuple[str, Optional[str]]:
+    """
+    Runs a single test case against a freshly-reset database, returning the
+    report for it and who the browser is logged in as afterwards.
+    """
+    report = []
+    report.append(case_heading(uci, uc, tci, tc))
+    report.append(f"```yaml\n")
+    report.append(yaml.dump(tc))
+    report.append(f"```\n\n")
+
+    print()
+    print(f"=== EXECUTING {uci+1}.{tci+1} {uc['Name']} ({tc['Name']})")
+
+    print("... resetting restaurant database")
+    app.reset_db()
+
+    # flash messages from the last test case which weren't shown yet mustn't
+    # show up in this one (even if we stay logged in as the same user)
+    if chrome.current_url.startswith(app.url):
+        chrome.delete_cookie(main.BaseHandler.FLASH_COOKIE_NAME)
+
+    print(f"--- InitialState")
+    if 'LoggedInUser' in tc['InitialState']:
+        if tc['InitialState']['LoggedInUser'] and tc['InitialState']['LoggedInUser'] == logged_in:
+            # the sample users are restored by reset_db, so the login cookie is still good
+            print(f"... already logged in as {logged_in}")
+        else:
+            print(f"... logging in as {tc['InitialState']['LoggedInUser']} with password 'password'")
+            chrome.delete_all_cookies()
+            logged_in = None
+            if tc['InitialState']['LoggedInUser']:
+                chrome.get(f"{app.url}/account/login")
+                chrome.find_element(By.CSS_SELECTOR, "input[name='username']").send_keys(tc['InitialState']['LoggedInUser'])
+                chrome.find_element(By.CSS_SELECTOR, "input[name='password']").send_keys("password")
+                chrome.find_element(By.CSS_SELECTOR, "input[type='submit']").click()
+                logged_in = chrome.execute_script(_JS_USERNAME)
+    if 'Page' in tc['InitialState']:
+        print(f"... navigating to {tc['InitialState']['Page']}")
+        chrome.get(f"{app.url}{tc['InitialState']['Page']}")
+    else:
+        raise ValueError(f"missing InitialState.Page")
+    print("... saving screenshot")
+    chrome.save_screenshot(f"A4/main.{uci+1}.{tci+1}.InitialState.png")
+
+    if 'InputData' in tc:
+        print("--- InputData")
+        for name, value in tc['InputData'].items():
+            if name not in ['action', 'force_action']:
+                print(f"... setting '{name}' to '{value}'")
+                inp = chrome.find_element(By.CSS_SELECTOR, f"input[name='{name}']")
+                inp.clear()
+                inp.send_keys(value)
+                chrome.execute_script(_JS_HIGHLIGHT, inp)
+        if 'action' in tc['InputData']:
+            print(f"... using action '{tc['InputData']['action']}'")
+            btn = chrome.find_element(By.CSS_SELECTOR, f"[name='action'][value='{tc['InputData']['action']}']")
+        elif 'force_action' in tc['InputData']:
+            print(f"... using FORCED (i.e., not actually there) action '{tc['InputData']['force_action']}'")
+            btn = chrome.execute_script(_JS_FORCE_ACTION, tc['InputData']['force_action'])
+        else:
+            print(f"... using submit button")
+            btn = chrome.find_element(By.CSS_SELECTOR, f"input[type='submit']")
+        chrome.execute_script(_JS_HIGHLIGHT, btn)
+        print("... saving screenshot")
+        chrome.save_screenshot(f"A4/main.{uci+1}.{tci+1}.InputData.png")
+    else:
+        btn = None
+
+    print("--- ExpectedOutput")
+    if btn:
+        print("... clicking action")
+        btn.click()
+
+    print("... saving screenshot")
+    chrome.save_screenshot(f"A4/main.{uci+1}.{tci+1}.Output.png")
+
+    # the test may have logged in or out
+    logged_in = chrome.execute_script(_JS_USERNAME)
+
+    passed = True
+    if 'ExpectedOutput' in tc:
+        try:
+            for check, data in tc['ExpectedOutput'].items():
+                print(f"??? running check {check}({repr(data)})")
+                if check == 'Page':
+                    res = chrome.execute_script(_JS_PATHNAME)
+                    assert res == data, f"incorrect path {repr(res)}"
+                elif check == 'Message':
+                    res = chrome.execute_script(_JS_FLASH)
+                    assert data in res, f"incorrect message {repr(res)}"
+                elif check == 'LoggedInUser':
+                    res = chrome.execute_script(_JS_USERNAME)
+                    assert data == res, f"incorrect username {repr(res)}"
+                elif check == 'VisibleOrderIDs':
+                    res = chrome.execute_script(_JS_ORDER_IDS)
+                    assert all([str(x) in res for x in data]), f"missing one or more orderid from page with {repr(res)}"
+                elif check == 'NotVisibleOrderIDs':
+                    res = chrome.execute_script(_JS_ORDER_IDS)
+                    assert all([str(x) not in res for x in data]), f"have one or more supposedly missing orderid from page with {repr(res)}"
+                elif check == 'VisibleRestaurantIDs':
+                    res = chrome.execute_script(_JS_RESTAURANT_IDS)
+                    assert all([str(x) in res for x in data]), f"missing one or more restaurantid from page with {repr(res)}"
+                elif check == 'RestaurantName':
+                    res = chrome.execute_script(_JS_RESTAURANT_NAME)
+                    assert data in res, f"restaurant name not in header {repr(res)}"
+                elif check == 'VisibleMenuItems':
+                    res = chrome.execute_script(_JS_MENU_ITEMS)
+                    assert set(res) == set(data), f"menu items do not exactly match {repr(res)}"
+                elif check == 'VisibleButtons':
+                    res = chrome.execute_script(_JS_ACTIONS)
+                    assert all([str(x) in res for x in data]), f"missing one or more actions from page with {repr(res)}"
+                elif check == 'OrderItems':
+                    res = chrome.execute_script(_JS_ORDER_ITEMS)
+                    assert set(res) == set(data), f"order items do not exactly match {repr(res)}"
+                elif check == 'OrderStatus':
+                    res = chrome.execute_script(_JS_ORDER_STATUS)
+                    assert res == data
+                elif check == 'RestaurantListContainsName':
+                    res = chrome.execute_script(_JS_RESTAURANT_NAMES)
+                    assert all([str(x) in res for x in data]), f"missing one or more restaurant names from page with {repr(res)}"
+                elif check == 'NotVisibleRestaurantNames':
+                    res = chrome.execute_script(_JS_RESTAURANT_NAMES)
+                    assert all([str(x) not in res for x in data]), f"have one or more supposedly missing restaurant names from page with {repr(res)}"
+                elif check == 'VisibleEmployeeUsernames':
+                    res = chrome.execute_script(_JS_EMPLOYEE_USERNAMES)
+                    assert all([str(x) in res for x in data]), f"missing one or more employee usernames from page with {repr(res)}"
+                else:
+                    raise ValueError(f"wtf: didn't implement check {check}?!?")
+        except AssertionError as ex:
+            print(f'\n!!! CHECK FAILED: {str(ex)}')
+            report.append(f'**CHECK FAILURE: ** `{check}({repr(data)})` - {str(ex)}\n\n')
+            passed = False
+
+    if passed:
+        print("*** TEST PASSED")
+        report.append(f'**TEST PASSED**\n\n')
+    else:
+        print("!!! TEST FAILED")
+        report.append(f'**TEST FAILED**\n\n')
+
+    report.append(f'| InitialState | InputData | Output |\n')
+    report.append(f'| --- | --- | --- |\n')
+    report.append(f'| ![N/A](main.{uci+1}.{tci+1}.InitialState.png) | ![N/A](main.{uci+1}.{tci+1}.InputData.png) | ![N/A](main.{uci+1}.{tci+1}.Output.png) |\n\n')
+
+    return "".join(report), logged_in
+
+
+def run_test_cases(worker: int, cases: List[Tuple[int, dict, int, dict]]) -> List[Tuple[int, int, str]]:
+    """
+    Runs some of the test cases with a separate browser and server (on its own
+    port), returning the (uci, tci, report) for each one. A test case which
+    crashes (e.g., if the browser or server dies) gets a failed report instead,
+    so the ones which already ran aren't lost.
+    """
+    print(f"... starting chrome and restaurant server for worker {worker}")
+    with Chrome(width=800, height=1000) as chrome, App(port=8080+worker) as app:
+
+        # who the browser is currently logged in as, if anyone
+        logged_in = None
+
+        results = []
+        for uci, uc, tci, tc in cases:
+            try:
+                report, logged_in = run_test_case(chrome, app, uci, uc, tci, tc, logged_in)
+            except Exception as ex:
+                print(f"\n!!! TEST CRASHED: {ex!r}")
+                report = case_heading(uci, uc, tci, tc) + f"**TEST FAILED** (crashed: `{ex!r}`)\n\n"
+                logged_in = None  # don't know, so log in again for the next one
+            results.append((uci, tci, report))
+        return results
+
+
 if __name__ == "__main__":
     print("... loading test cases")
-    with open('A1/TESTCASES.yml', 'r') as f:
-        testcases = yaml.load(f, Loader=yaml.Loader)
-
-    report = "" # pandoc markdown
-    report += f"---\n"
-    report += f"title: 'main_test'\n"
-    report += f"author: Group 25\n"
-    report += f"geometry: paperheight=10.5in,paperwidth=14in,margin=1cm\n"
-    report += f"---\n\n"
-
-    print("... starting chrome")
-    with Chrome(width=800, height=1000) as chrome:
-
-        for uci, uc in enumerate(testcases):
-
-            report += f"\n\n\\newpage\n\n"
-            report += f"### {uci+1}. {uc['Name']}\n\n"
-            report += f"**Objective**: {uc['Objective']}\n\n"
-            report += f"**Arrange**: {uc['Arrange']}\n\n"
-            report += f"**Act**: {uc['Act']}\n\n"
-            report += f"**Assert**: {uc['Assert']}\n\n"
-
-            for tci, tc in enumerate(uc['TestCases']):
-
-                report += f"\n\n\\newpage\n\n"
-                report += f"#### {uci+1}.{tci+1}. {uc['Name']} ({tc['Name']})\n\n"
-                report += f"```yaml\n"
-                report += yaml.dump(tc)
-                report += f"```\n\n"
-
-                print()
-                print(f"=== EXECUTING {uci+1}.{tci+1} {uc['Name']} ({tc['Name']})")
-
-                print("... starting restaurant server")
-                with App(port=8080) as app:
-
-                    print(f"--- InitialState")
-                    if 'LoggedInUser' in tc['InitialState']:
-                        print(f"... logging in as {tc['InitialState']['LoggedInUser']} with password 'password'")
-                        chrome.delete_all_cookies()
-                        if tc['InitialState']['LoggedInUser']:
-                            chrome.get(f"{app}/account/login")
-                            chrome.find_element(By.CSS_SELECTOR, "input[name='username']").send_keys(tc['InitialState']['LoggedInUser'])
-                            chrome.find_element(By.CSS_SELECTOR, "input[name='password']").send_keys("password")
-                            chrome.find_element(By.CSS_SELECTOR, "input[type='submit']").click()
-                    if 'Page' in tc['InitialState']:
-                        print(f"... navigating to {tc['InitialState']['Page']}")
-                        chrome.get(f"{app}{tc['InitialState']['Page']}")
-                    else:
-                        raise ValueError(f"missing InitialState.Page")
-                    print("... saving screenshot")
-                    chrome.save_screenshot(f"A4/main.{uci+1}.{tci+1}.InitialState.png")
-
-                    if 'InputData' in tc:
-                        print("--- InputData")
-                        for name, value in tc['InputData'].items():
-                            if name not in ['action', 'force_action']:
-                                print(f"... setting '{name}' to '{value}'")
-                                inp = chrome.find_element(By.CSS_SELECTOR, f"input[name='{name}']")
-                                inp.clear()
-                                inp.send_keys(value)
-                                chrome.execute_script("arguments[0].setAttribute('style', 'outline: red dashed 3px !important')", inp)
-                        if 'action' in tc['InputData']:
-                            print(f"... using action '{tc['InputData']['action']}'")
-                            btn = chrome.find_element(By.CSS_SELECTOR, f"[name='action'][value='{tc['InputData']['action']}']")
-                        elif 'force_action' in tc['InputData']:
-                            print(f"... using FORCED (i.e., not actually there) action '{tc['InputData']['force_action']}'")
-                            btn = chrome.execute_script("""
-                                return (action => {
-                                    let btn = document.querySelector('form').appendChild(document.createElement('button'))
-                                    btn.textContent = 'FORCED ACTION: ' + action
-                                    btn.setAttribute('name', action)
-                                    btn.setAttribute('value', action)
-                                    btn.setAttribute('style', 'outline: red dashed 3px !important')
-                                    return btn
-                                })(arguments[0])
-                            """, tc['InputData']['force_action'])
-                        else:
-                            print(f"... using submit button")
-                            btn = chrome.find_element(By.CSS_SELECTOR, f"input[type='submit']")
-                        chrome.execute_script("arguments[0].setAttribute('style', 'outline: red dashed 3px !important')", btn)
-                        print("... saving screenshot")
-                        chrome.save_screenshot(f"A4/main.{uci+1}.{tci+1}.InputData.png")
-                    else:
-                        btn = None
-
-                    print("--- ExpectedOutput")
-                    if btn:
-                        print("... clicking action")
-                        btn.click()
-
-                    print("... saving screenshot")
-                    chrome.save_screenshot(f"A4/main.{uci+1}.{tci+1}.Output.png")
-
-                    passed = True
-                    if 'ExpectedOutput' in tc:
-                        try:
-                            for check, data in tc['ExpectedOutput'].items():
-                                print(f"??? running check {check}({repr(data)})")
-                                if check == 'Page':
-                                    res = chrome.execute_script("return window.location.pathname")
-                                    assert res == data, f"incorrect path {repr(res)}"
-                                elif check == 'Message':
-                                    res = chrome.execute_script("return Array.from(document.querySelectorAll('aside.flash')).map(el => el.textContent.trim()).join('\\n')")
-                                    assert data in res, f"incorrect message {repr(res)}"
-                                elif check == 'LoggedInUser':
-                                    res = chrome.execute_script("return document.querySelector('[data-username]')?.dataset?.username ?? null")
-                                    assert data == res, f"incorrect username {repr(res)}"
-                                elif check == 'VisibleOrderIDs':
-                                    res = chrome.execute_script("return Array.from(document.querySelectorAll('[data-orderid]')).map(el => el.dataset.orderid)")
-                                    assert all([str(x) in res for x in data]), f"missing one or more orderid from page with {repr(res)}"
-                                elif check == 'NotVisibleOrderIDs':
-                                    res = chrome.execute_script("return Array.from(document.querySelectorAll('[data-orderid]')).map(el => el.dataset.orderid)")
-                                    assert all([str(x) not in res for x in data]), f"have one or more supposedly missing orderid from page with {repr(res)}"
-                                elif check == 'VisibleRestaurantIDs':
-                                    res = chrome.execute_script("return Array.from(document.querySelectorAll('[data-restaurantid]')).map(el => el.dataset.restaurantid)")
-                                    assert all([str(x) in res for x in data]), f"missing one or more restaurantid from page with {repr(res)}"
-                                elif check == 'RestaurantName':
-                                    res = chrome.execute_script("return document.querySelector('header > h1').textContent.trim()")
-                                    assert data in res, f"restaurant name not in header {repr(res)}"
-                                elif check == 'VisibleMenuItems':
-                                    res = chrome.execute_script("""
-                                        return Array.from(document.querySelectorAll("section.menu > .item > .name"))
-                                            .map(el => el.tagName == "INPUT" ? el.value : el.textContent)
-                                            .map(v => v.trim())
-                                            .filter(v => v.length)
-                                    """)
-                                    assert set(res) == set(data), f"menu items do not exactly match {repr(res)}"
-                                elif check == 'VisibleButtons':
-                                    res = chrome.execute_script("return Array.from(document.querySelectorAll('[name=action]')).map(el => el.value)")
-                                    assert all([str(x) in res for x in data]), f"missing one or more actions from page with {repr(res)}"
-                                elif check == 'OrderItems':
-                                    res = chrome.execute_script("""
-                                        return Array.from(document.querySelectorAll("section.menu > .item"))
-                                            .map(el => `${el.querySelector('.name').textContent.trim()}=${el.querySelector('.quantity').textContent.trim()}`)
-                                    """)
-                                    assert set(res) == set(data), f"order items do not exactly match {repr(res)}"
-                                elif check == 'OrderStatus':
-                                    res = chrome.execute_script("return document.querySelector('header.page--order').dataset.orderstatus")
-                                    assert res == data
-                                elif check == 'RestaurantListContainsName':
-                                    res = chrome.execute_script("return Array.from(document.querySelectorAll('section.restaurants > a')).map(el => el.textContent.trim())")
-                                    assert all([str(x) in res for x in data]), f"missing one or more restaurant names from page with {repr(res)}"
-                                elif check == 'NotVisibleRestaurantNames':
-                                    res = chrome.execute_script("return Array.from(document.querySelectorAll('section.restaurants > a')).map(el => el.textContent.trim())")
-                                    assert all([str(x) not in res for x in data]), f"have one or more supposedly missing restaurant names from page with {repr(res)}"
-                                elif check == 'VisibleEmployeeUsernames':
-                                    res = chrome.execute_script("return Array.from(document.querySelectorAll('section.employees > .employee > .username')).map(el => el.textContent.trim())")
-                                    assert all([str(x) in res for x in data]), f"missing one or more employee usernames from page with {repr(res)}"
-                                else:
-                                    raise ValueError(f"wtf: didn't implement check {check}?!?")
-                        except AssertionError as ex:
-                            print(f'\n!!! CHECK FAILED: {str(ex)}')
-                            report += f'**CHECK FAILURE: ** `{check}({repr(data)})` - {str(ex)}\n\n'
-                            passed = False
-
-                    if passed:
-                        print("*** TEST PASSED")
-                        report += f'**TEST PASSED**\n\n'
-                    else:
-                        print("!!! TEST FAILED")
-                        report += f'**TEST FAILED**\n\n'
-
-                    report += f'| InitialState | InputData | Output |\n'
-                    report += f'| --- | --- | --- |\n'
-                    report += f'| ![N/A](main.{uci+1}.{tci+1}.InitialState.png) | ![N/A](main.{uci+1}.{tci+1}.InputData.png) | ![N/A](main.{uci+1}.{tci+1}.Output.png) |\n\n'
-
-                    # note: we write the report after each case on purpose
-                    os.makedirs("A4", exist_ok=True)
-                    with open('A4/A4_Part1.md', 'w') as f:
-                        f.write(report)
+    testcases = main.load_yaml('A1/TESTCASES.yml')
+
+    # the test cases are independent, so split them between several browsers and servers
+    cases = [(uci, uc, tci, tc) for uci, uc in enumerate(testcases) for tci, tc in enumerate(uc['TestCases'])]
+    workers = max(1, min(int(os.environ.get("MAIN_TEST_WORKERS", 4)), len(cases)))
+
+    report = [] # pandoc markdown
+    report.append(f"---\n")
+    report.append(f"title: 'main_test'\n")
+    report.append(f"author: Group 25\n")
+    report.append(f"geometry: paperheight=10.5in,paperwidth=14in,margin=1cm\n")
+    report.append(f"---\n\n")
+
+    # the report for each use case, followed by its test cases in order (filled in as they finish)
+    sections = []
+    for uci, uc in enumerate(testcases):
+        section = []
+        section.append(f"\n\n\\newpage\n\n")
+        section.append(f"### {uci+1}. {uc['Name']}\n\n")
+        section.append(f"**Objective**: {uc['Objective']}\n\n")
+        section.append(f"**Arrange**: {uc['Arrange']}\n\n")
+        section.append(f"**Act**: {uc['Act']}\n\n")
+        section.append(f"**Assert**: {uc['Assert']}\n\n")
+        sections.append(["".join(section)] + [""] * len(uc['TestCases']))
+
+    os.makedirs("A4", exist_ok=True)
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        futures = {executor.submit(run_test_cases, worker, cases[worker::workers]): cases[worker::workers] for worker in range(workers)}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                results = future.result()
+            except Exception as ex:
+                # i.e., the browser or server couldn't be started (or the worker died), so all of its cases failed
+                print(f"\n!!! WORKER CRASHED: {ex!r}")
+                results = [(uci, tci, case_heading(uci, uc, tci, tc) + f"**TEST FAILED** (worker crashed: `{ex!r}`)\n\n") for uci, uc, tci, tc in futures[future]]
+            for uci, tci, case_report in results:
+                sections[uci][tci+1] = case_report
+
+            # note: we write the report after each worker finishes on purpose (in order, with the cases which have finished so far)
+            with open('A4/A4_Part1.md', 'w') as f:
+                f.write("".join(report))
+                for section in sections:
+                    f.write("".join(section))
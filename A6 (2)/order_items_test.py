@@ -0,0 +1,109 @@
+"""
+Tests for the JSON order items endpoint (POST /orders/{id}/items), using a
+fresh database for each test.
+"""
+
+
+import json
+import os
+import sqlite3
+import tempfile
+
+import tornado.testing
+import tornado.web
+
+import main
+
+
+with open("database.sql", "r") as f:
+    _SCHEMA_SQL = f.read()
+
+
+class OrderItemsTest(tornado.testing.AsyncHTTPTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        filename = os.path.join(self.tmp.name, "restaurant.db")
+        conn = sqlite3.connect(filename)
+        conn.executescript(_SCHEMA_SQL)
+        conn.close()
+
+        # a restaurant with two items (1 and 2), a pending order (1) and a paid
+        # one (2) for the customer, and a pending order (3) for someone else
+        self.db = main.RestaurantDB(filename, readers=2)
+        with self.db.batch():
+            for username in ["owner", "customer", "other"]:
+                self.db.create_account(username, "password", "Test", "User")
+            restaurant_id = self.db.create_restaurant("Test Restaurant", "owner")
+            self.db.add_menu_items(restaurant_id, [("Water", 123), ("Burger", 345)])
+            self.db.create_order(restaurant_id, "customer")
+            self.db.create_order(restaurant_id, "customer")
+            self.db.create_order(restaurant_id, "other")
+            self.db.conn.execute("UPDATE Orders SET Status = ? WHERE OrderID = 2", (main.RestaurantDB.ORDER_PAID,))
+        super().setUp()
+
+    def tearDown(self):
+        super().tearDown()
+        self.db.close()
+        self.tmp.cleanup()
+
+    def get_app(self) -> tornado.web.Application:
+        return main.restaurant(self.db)
+
+    def post_items(self, order_id: int, body, username: str = "customer"):
+        """
+        Posts the body (JSON-encoded unless it's a string) to the order items
+        endpoint, returning the status code and decoded response.
+        """
+        headers = {}
+        if username is not None:
+            cookie = tornado.web.create_signed_value(self._app.settings["cookie_secret"], main.BaseHandler.USERNAME_COOKIE_NAME, username)
+            headers["Cookie"] = f"{main.BaseHandler.USERNAME_COOKIE_NAME}={cookie.decode()}"
+        res = self.fetch(f"/orders/{order_id}/items", method="POST", headers=headers, body=body if isinstance(body, str) else json.dumps(body))
+        return res.code, json.loads(res.body)
+
+    def quantities(self, order_id: int) -> dict:
+        return {item["Name"]: item["Quantity"] for item in self.db.get_order(order_id)["Items"]}
+
+    def test_ok(self):
+        code, res = self.post_items(1, [[1, 2], [2, 1], [1, -1]])
+        self.assertEqual(code, 200)
+        self.assertEqual({item["Name"]: item["Quantity"] for item in res["Items"]}, {"Water": 1, "Burger": 1})
+        self.assertEqual(self.quantities(1), {"Water": 1, "Burger": 1})
+
+    def test_bad_body(self):
+        for body in ["not json", "{}", '{"12": 1}', "[1]", '["12"]', "[[1]]", "[[1, 2, 3]]", '[["a", 1]]', "[[1, null]]"]:
+            with self.subTest(body=body):
+                code, res = self.post_items(1, body)
+                self.assertEqual(code, 400)
+                self.assertEqual(res, {"Error": "Bad item deltas."})
+
+    def test_not_logged_in(self):
+        code, res = self.post_items(1, [[1, 1]], username=None)
+        self.assertEqual(code, 401)
+        self.assertEqual(res, {"Error": "Not logged in."})
+
+    def test_not_owner(self):
+        code, res = self.post_items(3, [[1, 1]])
+        self.assertEqual(code, 403)
+        self.assertEqual(res, {"Error": "Not the order owner."})
+        self.assertEqual(self.quantities(3), {"Water": 0, "Burger": 0})
+
+    def test_no_order(self):
+        code, res = self.post_items(99, [[1, 1]])
+        self.assertEqual(code, 404)
+        self.assertEqual(res, {"Error": "Order does not exist."})
+
+    def test_not_pending(self):
+        code, res = self.post_items(2, [[1, 1]])
+        self.assertEqual(code, 409)
+        self.assertIn("non-pending", res["Error"])
+
+    def test_unknown_item(self):
+        # none of the changes are applied if one of them fails
+        for item_id in [999, 2**63]:
+            with self.subTest(item_id=item_id):
+                code, res = self.post_items(1, [[1, 1], [item_id, 1]])
+                self.assertEqual(code, 400)
+                self.assertEqual(res, {"Error": "Unknown menu item."})
+                self.assertEqual(self.quantities(1), {"Water": 0, "Burger": 0})
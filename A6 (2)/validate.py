@@ -2,19 +2,33 @@
 Contains functions to validate, normalize, and parse various fields.
 """
 
+import re
+
+def _strip_bounded(value: str, max_length: int, field: str, blank: str = "blank") -> str:
+    """
+    Strips a field, checking it isn't blank or longer than max_length.
+    """
+    # isspace is true for exactly the strings strip would empty (except ""),
+    # so blank values are rejected without making a stripped copy first
+    if value == "" or value.isspace():
+        raise ValueError(f"{field} must not be {blank}")
+    value = value.strip()
+    if len(value) > max_length:
+        raise ValueError(f"{field} too long")
+    return value
+
+# only the ASCII digits (str.isdigit also accepts other scripts' digits)
+_DIGITS = frozenset("0123456789")
+
+_USERNAME_CHARS = frozenset("abcdefghijklmnopqrstuvwxyz0123456789._")
+
 def validate_account_username(username: str) -> str:
     """
     Validates and normalizes a username.
     """
-    username = username.strip()
-    if username == "":
-        raise ValueError("username must not be empty")
-    if len(username) > 24:
-        raise ValueError("username too long")
-    for char in username:
-        if not (char.isalnum() and char.isascii() and char.islower()):
-            if char not in [".", "_"]:
-                raise ValueError("username must only contain lowercase letters, numbers, dots, and underscores")
+    username = _strip_bounded(username, 24, "username", "empty")
+    if not _USERNAME_CHARS.issuperset(username):
+        raise ValueError("username must only contain lowercase letters, numbers, dots, and underscores")
     return username
 
 def validate_account_password(password: str) -> str:
@@ -29,12 +43,10 @@ def validate_restaurant_name(restaurant_name: str) -> str:
     """
     Validate and normalizes a restaurant name.
     """
-    restaurant_name = restaurant_name.strip()
-    if restaurant_name == "":
-        raise ValueError("restaurant name must not be blank")
-    if len(restaurant_name) > 100:
-        raise ValueError("restaurant name too long")
-    return restaurant_name
+    return _strip_bounded(restaurant_name, 100, "restaurant name")
+
+# the luhn value of each doubled digit (i.e., 2*d with the digits summed)
+_LUHN_DOUBLED = (0, 2, 4, 6, 8, 1, 3, 5, 7, 9)
 
 def validate_account_card_number(number: str) -> str:
     """
@@ -43,16 +55,17 @@ def validate_account_card_number(number: str) -> str:
     number = number.strip()
     if number == "":
         raise ValueError("card number must not be blank")
-    if not (number.isdigit() and number.isascii()):
+    # isascii is just a flag check, and bytes.isdigit only accepts 0-9
+    digits = number.encode("ascii") if number.isascii() else b""
+    if not digits.isdigit():
         raise ValueError("card number must only contain numbers")
-    # based on https://dev.to/seraph776/validate-credit-card-numbers-using-python-37j9
-    digits = [int(num) for num in number]
-    checkDigit = digits.pop(-1)
-    digits.reverse()
-    digits = [num * 2 if idx % 2 == 0 else num for idx, num in enumerate(digits)]
-    digits = [num - 9 if idx % 2 == 0 and num > 9 else num for idx, num in enumerate(digits)]
-    digits.append(checkDigit)
-    checkSum = sum(digits)
+    # luhn checksum: every second digit from the right (starting with the one
+    # before the check digit) is doubled, with the digits of the result summed
+    checkSum = 0
+    n = len(digits)
+    for idx, c in enumerate(digits):
+        num = c - 48
+        checkSum += _LUHN_DOUBLED[num] if (n - idx) % 2 == 0 else num
     if checkSum % 10 != 0:
         raise ValueError("invalid credit card number")
     return number
@@ -64,7 +77,7 @@ def validate_account_card_code(code: str) -> str:
     code = code.strip()
     if code == "" or len(code) > 3:
         raise ValueError("invalid card code")
-    if not (code.isdigit() and code.isascii()):
+    if not _DIGITS.issuperset(code):
         raise ValueError("card code must only contain numbers")
     return code
 
@@ -73,11 +86,12 @@ def validate_account_card_expiry(date: str) -> str:
     Validate card expiry number
     """
     date = date.strip()
-    if len(date) != 5 or date[2] != '/' or not date.isascii() or not date[0:2].isnumeric() or not date[3:5].isnumeric():
+    month, year = date[:2], date[3:]
+    if len(date) != 5 or date[2] != "/" or not _DIGITS.issuperset(month + year):
         raise ValueError("invalid card expiry (must be MM/YY)")
 
-    month = int(date[0:2])
-    if not 1 <= month <= 12:
+    # both are two digits, so comparing the strings is the same as comparing the numbers
+    if not "01" <= month <= "12":
         raise ValueError("invalid card expiry month")
 
     return date
@@ -86,34 +100,21 @@ def validate_account_address(address: str) -> str:
     """
     Validates and normalizes an address.
     """
-    address = address.strip()
-    if address == "":
-        raise ValueError("address must not be blank")
-    if len(address) > 500:
-        raise ValueError("address too long")
-    return address
+    return _strip_bounded(address, 500, "address")
 
 def validate_menu_item(item: str) -> str:
     """
     Validates and normalizes a menu item name.
     """
-    item = item.strip()
-    if item == "":
-        raise ValueError("item name must not be empty")
-    if len(item) > 100:
-        raise ValueError("item name too long")
-    return item
+    return _strip_bounded(item, 100, "item name", "empty")
 
 def validate_first_last_name(name: str) -> str:
     """
     Validates and normalizes a first/last name.
     """
-    name = name.strip()
-    if name == "":
-        raise ValueError("first name must not be empty")
-    if len(name) > 100:
-        raise ValueError("first name too long")
-    return name
+    return _strip_bounded(name, 100, "first name", "empty")
+
+_PRICE_RE = re.compile(r"([0-9]*)(?:\.([0-9]*))?")
 
 def validate_price(price: str) -> int:
     """
@@ -122,7 +123,11 @@ def validate_price(price: str) -> int:
     price = price.strip().lstrip("$").strip()
     if price == "":
         raise ValueError("price must not be blank")
-    price = float(price) * 100
-    if price < 0 or price % 1 != 0:
+    m = _PRICE_RE.fullmatch(price)
+    if not m or price == ".":
+        raise ValueError("invalid price")
+    # parsed as integer cents, since floats can't represent most of them exactly
+    dollars, cents = m.group(1), (m.group(2) or "").rstrip("0")
+    if len(cents) > 2:
         raise ValueError("invalid price")
-    return int(price)
+    return int(dollars or "0") * 100 + int(cents.ljust(2, "0"))
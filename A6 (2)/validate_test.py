@@ -1,26 +1,44 @@
 """
 Black-box tests for the validation functions using input partitioning.
+
+The cases don't share any state, so they can be run in parallel with
+pytest-xdist ("pytest -n auto --dist loadfile" keeps this file on one worker,
+so validate is only imported once).
 """
 
 
 import pytest
 
-from typing import Callable
+from typing import Any, Callable
+
+from validate import (
+    validate_account_username,
+    validate_account_password,
+    validate_restaurant_name,
+    validate_account_card_number,
+    validate_account_card_code,
+    validate_account_card_expiry,
+    validate_account_address,
+    validate_menu_item,
+    validate_first_last_name,
+    validate_price,
+)
 
 
-def do_validate_test(func: Callable[[str], any], input: str, expected: any):
+def do_validate_test(func: Callable[[str], Any], input: str, expected: Any):
     """
-    Runs a paramaterized test against a validate function.
+    Runs a paramaterized test against a validate function (an expected value
+    of None means it should raise a ValueError).
     """
-    actual = None
-    try:
-        actual = func(input)
-    except:
-        pass
     if expected is None:
-        assert actual == None, f"'{input}' should have been invalid; got '{actual}'"
+        with pytest.raises(ValueError):
+            func(input)
     else:
-        assert actual == expected, f"'{input}' should have been parsed into '{expected}'"
+        assert func(input) == expected, f"'{input}' should have been parsed into '{expected}'"
+
+
+# a long but valid value, shared by the length tests
+_LONG_NAME = "dD5PmKQ7SU5ornjAOv5J7VrzNtYqRgmoOfksFYvrRaFjdhsdhjsdhsjdhsTvaEVmJyGDtPtE6sNbgEXyvWFnYQPErQSnzBxG4Hs"
 
 
 @pytest.mark.parametrize("input, expected", [
@@ -44,11 +62,11 @@ def do_validate_test(func: Callable[[str], any], input: str, expected: any):
     ("abcdefghijklmnopqrstuvwx", "abcdefghijklmnopqrstuvwx"), # 24
     ("ab_c", "ab_c"),
     ("ab.c", "ab.c"),
+    ("abc123", "abc123"), # numbers
     ("  dabcdeffhijklmn", "dabcdeffhijklmn"),
     ("dabcdeffhijklmn", "dabcdeffhijklmn"),
 ])
 def test_validate_account_username(input, expected):
-    from validate import validate_account_username
     do_validate_test(validate_account_username, input, expected)
 
 
@@ -64,7 +82,6 @@ def test_validate_account_username(input, expected):
     ("ABC12@3DEF", "ABC12@3DEF"),
 ])
 def test_validate_account_password(input, expected):
-    from validate import validate_account_password
     do_validate_test(validate_account_password, input, expected)
 
 
@@ -79,13 +96,12 @@ def test_validate_account_password(input, expected):
     ("  dD5PmKQ7SU5ornjAOv5J7VrzNtYqRgmoOfksFYvrRadsdjksdjksdjksdjskdjskFTvaEVmJyGDtPtE6sNbgEXyvWFnYQPErQSnzBxG4HsFNvaoGrcF5RaJd8j dD5PmKQ7SU5ornjAOv5J7VrzNtYqRgmoOfksFYvrRaFTvaEVmJyGDtPtE6sNbgEXyvWFnYQPErQSnzBxG4HsFNvaoGrcF5RaJd8j ", None), # > 100, with trimmed spaces
 
     # valid
-    ("dD5PmKQ7SU5ornjAOv5J7VrzNtYqRgmoOfksFYvrRaFjdhsdhjsdhsjdhsTvaEVmJyGDtPtE6sNbgEXyvWFnYQPErQSnzBxG4Hs", "dD5PmKQ7SU5ornjAOv5J7VrzNtYqRgmoOfksFYvrRaFjdhsdhjsdhsjdhsTvaEVmJyGDtPtE6sNbgEXyvWFnYQPErQSnzBxG4Hs"), # 100
+    (_LONG_NAME, _LONG_NAME), # 100
     ("241Pizza", "241Pizza"),
     ("McDonalds", "McDonalds"),
     (" subway ", "subway"),
-])
+], ids=["empty", "space", "spaces", "too_long", "too_long_trimmed", "max_length", "digits", "simple", "trimmed"])
 def test_validate_restaurant_name(input, expected):
-    from validate import validate_restaurant_name
     do_validate_test(validate_restaurant_name, input, expected)
 
 
@@ -104,7 +120,6 @@ def test_validate_restaurant_name(input, expected):
     ("378734493671000", "378734493671000"),
 ])
 def test_validate_account_card_number(input, expected):
-    from validate import validate_account_card_number
     do_validate_test(validate_account_card_number, input, expected)
 
 
@@ -129,7 +144,6 @@ def test_validate_account_card_number(input, expected):
 
 ])
 def test_validate_account_card_code(input, expected):
-    from validate import validate_account_card_code
     do_validate_test(validate_account_card_code, input, expected)
 
 
@@ -154,7 +168,6 @@ def test_validate_account_card_code(input, expected):
     ("01/01", "01/01"),
 ])
 def test_validate_account_card_expiry(input, expected):
-    from validate import validate_account_card_expiry
     do_validate_test(validate_account_card_expiry, input, expected)
 
 
@@ -169,12 +182,11 @@ def test_validate_account_card_expiry(input, expected):
     (  "vHH8O9NUeF8VQUDtORuOYxyMFArYtZh2gWtoo87sJpo0H0Ftepkx6GYr88OHjR7gTX47TfVa7PpD5tAqH12TsozxdOoz0ZK6gUvbwrc8MEEqwKMeU9orMEyre2Wtev87MKSUqo5PoYATpNOjrwmMM8cpJEnfDdUhSzpobFFoh4mzMzHcqwOVPV9TAzk2NNg2FgYgZWeMwrc8MEEqwKMeU9orMEyre2Wtev87MKSUqo5PoYATpNOjrwmMM8cpJEnfDdUhSzpobFFoh4mzMzHcqwOVPV9TAzk2NNg2FgYgZWeMwrc8MEEqwKMeU9orMEyre2Wtev87MKSUqo5PoYATpNOjrwmMM8cpJEnfDdUhSzpobFFoh4mzMzHcqwOVPV9TAzk2NNg2FgYgZWeMsasawrc8MEEqwKMeU9orMEyre2Wtev87MKSUqo5PoYATpNOjrwmMM8cpJEnfDdUhSzpobFFoh4mzMzHcqwOVPV9TAzk2NNg2FgYgZWeM"  , None), # > 500, with trimmed spaces
 
     # valid
-    ("dD5PmKQ7SU5ornjAOv5J7VrzNtYqRgmoOfksFYvrRaFjdhsdhjsdhsjdhsTvaEVmJyGDtPtE6sNbgEXyvWFnYQPErQSnzBxG4Hs", "dD5PmKQ7SU5ornjAOv5J7VrzNtYqRgmoOfksFYvrRaFjdhsdhjsdhsjdhsTvaEVmJyGDtPtE6sNbgEXyvWFnYQPErQSnzBxG4Hs"), # 100
+    (_LONG_NAME, _LONG_NAME), # 100
     ("1234 Street AVE", "1234 Street AVE"),
     ("  1234 Street AVE  ", "1234 Street AVE"),
-])
+], ids=["empty", "space", "spaces", "too_long", "too_long_trimmed", "length_100", "simple", "trimmed"])
 def test_validate_account_address(input, expected):
-    from validate import validate_account_address
     do_validate_test(validate_account_address, input, expected)
 
 
@@ -184,11 +196,10 @@ def test_validate_account_address(input, expected):
     ("KjNzOuRpHsEfWcXqUdKyGwHbAeTiFzEiCmSdJlOrWnLuAfGvZxNpIyHbVuTaLqXjKrApXoLrEhAsDfFkYeLbVrKgPpYvDdViMfXoOxJjCrYiMlTgBhPnWkLaXsFeHlIeAeLlVoFbDkUvTgKqAuLtXnSvIzQgQmGoBmDzFDDSDSDSKjNzOuRpHsEfWcXqUdKyGwHbAeTiFzEiCmSdJlOrWnLuAfGvZxNpIyHbVuTaLqXjKrApXoLrEhAsDfFkYeLbVrKgPpYvDdViMfXoOxJjCrYiMlTgBhPnWkLaXsFeHlIeAeLlVoFbDkUvTgKqAuLtXnSvIzQgQmGoBmDzFDDSDSDS", None), # > 100
 
     # valid
-    ("dD5PmKQ7SU5ornjAOv5J7VrzNtYqRgmoOfksFYvrRaFjdhsdhjsdhsjdhsTvaEVmJyGDtPtE6sNbgEXyvWFnYQPErQSnzBxG4Hs", "dD5PmKQ7SU5ornjAOv5J7VrzNtYqRgmoOfksFYvrRaFjdhsdhjsdhsjdhsTvaEVmJyGDtPtE6sNbgEXyvWFnYQPErQSnzBxG4Hs"), # 100
+    (_LONG_NAME, _LONG_NAME), # 100
     ("Pizza", "Pizza"),
-])
+], ids=["empty", "too_long", "max_length", "simple"])
 def test_validate_menu_item(input, expected):
-    from validate import validate_menu_item
     do_validate_test(validate_menu_item, input, expected)
 
 
@@ -198,11 +209,10 @@ def test_validate_menu_item(input, expected):
     ("wFzLpHgDxKcYqZoUvEaIbNfRjQsXkHlMmCvGuTtXhJiYnOaEoVrZpSbCpWlPvQaAqGdUcLgXkWwYjXrHxToVrQnLuPdSrJkRfMiAqZvKuPmZlLvYfNwFbAtGmUeEjNoXpVhGgIhJtAmXsZzJpCrByCdRdLrGoRpKeKmAcZeRkIuMpLtYnHjOuVzTdHh", None), # > 100
 
     # valid
-    ("dD5PmKQ7SU5ornjAOv5J7VrzNtYqRgmoOfksFYvrRaFjdhsdhjsdhsjdhsTvaEVmJyGDtPtE6sNbgEXyvWFnYQPErQSnzBxG4Hs", "dD5PmKQ7SU5ornjAOv5J7VrzNtYqRgmoOfksFYvrRaFjdhsdhjsdhsjdhsTvaEVmJyGDtPtE6sNbgEXyvWFnYQPErQSnzBxG4Hs"), # 100
+    (_LONG_NAME, _LONG_NAME), # 100
     ("John", "John"),
-])
+], ids=["empty", "too_long", "max_length", "simple"])
 def test_validate_first_last_name(input, expected):
-    from validate import validate_first_last_name
     do_validate_test(validate_first_last_name, input, expected)
 
 
@@ -232,7 +242,8 @@ def test_validate_first_last_name(input, expected):
     (" $ 1.3",  130),
     (" $ 1.30 ",  130),
     (" $ 0001.30000 ",  130),
+    ("1.1",  110), # not exact as a float
+    ("0.29", 29), # not exact as a float
 ])
 def test_validate_price(input, expected):
-    from validate import validate_price
     do_validate_test(validate_price, input, expected)